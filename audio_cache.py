@@ -0,0 +1,249 @@
+"""
+Модуль локального кэша аудиофайлов.
+Часто воспроизводимые треки один раз сохраняются на диск в формате Ogg/Opus
+и затем воспроизводятся из файла без сети и без перекодирования.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import shlex
+import sqlite3
+import subprocess
+import threading
+import time
+import uuid
+from config import (
+    CACHE_DB_PATH, FFMPEG_OPTIONS, OPUS_BITRATE,
+    AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES, AUDIO_CACHE_MIN_PLAYS,
+    AUDIO_CACHE_EVICTION, AUDIO_CACHE_WORKERS
+)
+from metadata_cache import normalize_query
+from ffmpeg_supervisor import ffmpeg_supervisor, FFmpegBusyError, KIND_CACHE
+
+log = logging.getLogger(__name__)
+
+# Сколько обращений к файлам накапливается в памяти, прежде чем их время записывается в базу
+ACCESS_FLUSH_SIZE = 100
+
+# Порядок вытеснения файлов для каждой политики
+EVICTION_ORDER = {
+    'lru': "last_access",
+    'lfu': "play_count, last_access",
+}
+
+
+def file_digest(path):
+    """Считает SHA-256 содержимого файла."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AudioCache:
+    """Кэш треков в виде файлов Ogg/Opus, адресуемых по хешу содержимого."""
+
+    def __init__(self, directory=AUDIO_CACHE_DIR, db_path=CACHE_DB_PATH, *,
+                 max_bytes=AUDIO_CACHE_MAX_BYTES, min_plays=AUDIO_CACHE_MIN_PLAYS,
+                 eviction=AUDIO_CACHE_EVICTION):
+        self._dir = directory
+        self._max_bytes = max_bytes
+        self._min_plays = min_plays
+        self._eviction_order = EVICTION_ORDER[eviction]
+        self._semaphore = None  # Создается в цикле событий при первой загрузке
+        self._pending = set()  # Ключи треков, которые сейчас загружаются
+        self._listeners = []  # Функции (ключ трека, путь, путь к FFmpeg), вызываемые после сохранения трека
+        self._lock = threading.Lock()
+        self._touched = {}  # Ключ трека -> время последнего обращения, еще не записанное в базу
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS audio_plays (
+                track_key TEXT PRIMARY KEY,
+                play_count INTEGER,
+                last_access REAL,
+                digest TEXT,
+                size INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS audio_plays_digest ON audio_plays (digest);
+        """)
+        self._db.commit()
+
+    @property
+    def pending_jobs(self):
+        """Количество треков, которые сейчас сохраняются."""
+        return len(self._pending)
+
+    def add_listener(self, callback):
+        """Подписывает callback(ключ трека, путь к файлу, путь к FFmpeg) на сохранение треков в кэш."""
+        self._listeners.append(callback)
+
+    def _content_path(self, digest):
+        return os.path.join(self._dir, digest[:2], f"{digest}.ogg")
+
+    def lookup(self, track):
+        """Возвращает путь к сохраненному файлу трека или None."""
+        key = normalize_query(track.url)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT digest FROM audio_plays WHERE track_key = ? AND digest IS NOT NULL", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            path = self._content_path(row[0])
+            if not os.path.exists(path):
+                # Файл удален вручную - забываем о нем
+                self._db.execute("UPDATE audio_plays SET digest = NULL, size = NULL WHERE track_key = ?", (key,))
+                self._db.commit()
+                return None
+
+            # Время обращения нужно только для вытеснения: записываем его пачками, а не при каждом поиске
+            self._touched[key] = time.time()
+            if len(self._touched) >= ACCESS_FLUSH_SIZE:
+                self._flush_access()
+                self._db.commit()
+        return path
+
+    def record_play(self, track, *, ffmpeg_path="ffmpeg", force=False):
+        """Учитывает воспроизведение трека и при необходимости запускает его сохранение в фоне.
+
+        force - сохранить трек независимо от числа воспроизведений (например, при повторе).
+        """
+        key = normalize_query(track.url)
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO audio_plays (track_key, play_count, last_access) VALUES (?, 1, ?) "
+                "ON CONFLICT(track_key) DO UPDATE SET play_count = play_count + 1, last_access = excluded.last_access",
+                (key, time.time())
+            )
+            self._db.commit()
+            play_count, digest = self._db.execute(
+                "SELECT play_count, digest FROM audio_plays WHERE track_key = ?", (key,)
+            ).fetchone()
+
+        if digest or (play_count < self._min_plays and not force):
+            return
+        self.ensure(track, ffmpeg_path=ffmpeg_path)
+
+    def ensure(self, track, *, ffmpeg_path="ffmpeg"):
+        """Запускает сохранение трека на диск, если его еще нет в кэше."""
+        key = normalize_query(track.url)
+        if key in self._pending or not track.has_fresh_stream():
+            return
+        if self.lookup(track):
+            return
+
+        self._pending.add(key)
+        asyncio.get_running_loop().create_task(
+            self._populate(key, track.stream_url, track.codec, ffmpeg_path)
+        )
+
+    async def _populate(self, key, stream_url, codec, ffmpeg_path):
+        """Скачивает трек в Ogg/Opus и помещает его в кэш."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(AUDIO_CACHE_WORKERS)
+
+        os.makedirs(self._dir, exist_ok=True)
+        tmp_path = os.path.join(self._dir, f".tmp-{uuid.uuid4().hex}.ogg")
+        loop = asyncio.get_running_loop()
+
+        try:
+            async with self._semaphore:
+                args = [
+                    ffmpeg_path, '-nostdin', '-loglevel', 'error',
+                    *shlex.split(FFMPEG_OPTIONS['before_options']),
+                    '-i', stream_url,
+                    '-vn', '-map_metadata', '-1',
+                    # Opus сохраняем как есть, остальные кодеки перекодируем один раз
+                    '-c:a', 'copy' if codec == 'opus' else 'libopus',
+                    '-b:a', f'{OPUS_BITRATE}k',
+                    '-f', 'ogg', tmp_path,
+                ]
+                # Сохранение в кэш не ждет места под процесс: трек будет сохранен при следующем воспроизведении
+                async with ffmpeg_supervisor.spawn(timeout=0):
+                    process = ffmpeg_supervisor.adopt(
+                        await asyncio.create_subprocess_exec(
+                            *args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+                        ),
+                        kind=KIND_CACHE
+                    )
+                if await process.wait() != 0:
+                    log.warning("Не удалось сохранить трек в кэш: FFmpeg завершился с кодом %s", process.returncode)
+                    return
+
+            digest = await loop.run_in_executor(None, file_digest, tmp_path)
+            size = os.path.getsize(tmp_path)
+            path = self._content_path(digest)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+
+            with self._lock:
+                self._db.execute(
+                    "UPDATE audio_plays SET digest = ?, size = ? WHERE track_key = ?",
+                    (digest, size, key)
+                )
+                self._flush_access()
+                self._evict()
+                self._db.commit()
+            log.info("Трек сохранен в аудиокэш: %s", key)
+
+            for callback in self._listeners:
+                callback(key, path, ffmpeg_path)
+
+        except FFmpegBusyError:
+            log.debug("Сохранение трека в кэш отложено: достигнут лимит процессов FFmpeg")
+
+        except Exception:
+            log.exception("Ошибка при сохранении трека в кэш")
+
+        finally:
+            self._pending.discard(key)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _flush_access(self):
+        """Записывает накопленные времена обращений (вызывается под блокировкой, commit - за вызывающим)."""
+        if self._touched:
+            self._db.executemany(
+                "UPDATE audio_plays SET last_access = ? WHERE track_key = ?",
+                [(accessed, key) for key, accessed in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def _evict(self):
+        """Удаляет файлы сверх лимита размера согласно политике вытеснения."""
+        total = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM audio_plays WHERE digest IS NOT NULL)"
+        ).fetchone()[0]
+        if total <= self._max_bytes:
+            return
+
+        candidates = self._db.execute(
+            f"SELECT track_key, digest, size FROM audio_plays WHERE digest IS NOT NULL "
+            f"ORDER BY {self._eviction_order}"
+        ).fetchall()
+        for key, digest, size in candidates:
+            if total <= self._max_bytes:
+                break
+
+            self._db.execute("UPDATE audio_plays SET digest = NULL, size = NULL WHERE track_key = ?", (key,))
+            # Файл удаляем, только если на него больше не ссылается ни один трек
+            still_used = self._db.execute(
+                "SELECT 1 FROM audio_plays WHERE digest = ? LIMIT 1", (digest,)
+            ).fetchone()
+            if still_used:
+                continue
+
+            total -= size
+            try:
+                os.remove(self._content_path(digest))
+            except OSError:
+                pass
+
+
+# Общий аудиокэш для всего бота
+audio_cache = AudioCache()
@@ -0,0 +1,502 @@
+"""
+Набор замеров производительности бота без подключения к Discord и YouTube.
+Вместо yt-dlp используется подставной экстрактор с готовыми данными, аудио раздает
+локальный HTTP-сервер, а кадры потребляет подставной голосовой клиент.
+Результаты выводятся в формате JSON для сравнения между версиями.
+
+Запуск:
+    python benchmark.py [--only ttfa playlist cpu memory] [--output results.json]
+"""
+
+import argparse
+import asyncio
+import functools
+import hashlib
+import http.server
+import json
+import math
+import os
+import platform
+import resource
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import wave
+from urllib.parse import urlparse, parse_qs
+
+# Параметры тестового аудиофайла
+SAMPLE_RATE = 48000
+CHANNELS = 2
+TONE_FREQUENCY = 440
+
+# Сколько форматов содержит подставной ответ экстрактора (полные данные yt-dlp весят много)
+FAKE_FORMATS = 30
+
+BENCHMARKS = ('ttfa', 'playlist', 'cpu', 'memory')
+
+
+def write_tone(path, seconds):
+    """Создает WAV-файл с синусоидой заданной длительности."""
+    period = SAMPLE_RATE // TONE_FREQUENCY
+    frame = b''.join(
+        struct.pack('<hh', value, value)
+        for value in (int(8000 * math.sin(2 * math.pi * i / period)) for i in range(period))
+    )
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(CHANNELS)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(frame * (SAMPLE_RATE * seconds // period))
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    """Обработчик HTTP без вывода журнала запросов."""
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(directory):
+    """Запускает локальный HTTP-сервер для раздачи аудио и возвращает его."""
+    handler = functools.partial(QuietHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class FakeExtractor:
+    """Подставной экстрактор: возвращает готовые данные в формате yt-dlp."""
+
+    def __init__(self, audio_url, *, latency, incomplete_ratio, page_size):
+        self.audio_url = audio_url
+        self.latency = latency  # Имитация сетевой задержки одного извлечения (секунды)
+        self.incomplete_ratio = incomplete_ratio  # Доля записей плейлиста без названия и ссылки
+        self.page_size = page_size
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def info(self, video_id):
+        """Полные данные видео, как их возвращает yt-dlp."""
+        return {
+            'id': video_id,
+            'title': f'Benchmark track {video_id}',
+            'duration': 30,
+            'webpage_url': f'https://www.youtube.com/watch?v={video_id}',
+            'url': self.audio_url,
+            'acodec': 'pcm_s16le',
+            'extractor': 'youtube',
+            'ext': 'wav',
+            'formats': [
+                {'format_id': str(i), 'url': f'{self.audio_url}?format={i}', 'http_headers': {'User-Agent': 'x' * 100}}
+                for i in range(FAKE_FORMATS)
+            ],
+            'thumbnails': [{'url': f'https://i.ytimg.com/vi/{video_id}/{i}.jpg'} for i in range(20)],
+        }
+
+    def playlist_page(self, size, start, end):
+        """Страница плоского плейлиста из size записей."""
+        entries = []
+        for i in range(start, min(end, size) + 1):
+            video_id = f'pl{i:06d}'
+            if int(i * self.incomplete_ratio) != int((i - 1) * self.incomplete_ratio):
+                # Неполная запись: только ID, как у некоторых плоских ответов
+                entries.append({'id': video_id, 'ie_key': 'Youtube'})
+            else:
+                entries.append({
+                    'id': video_id,
+                    'title': f'Playlist track {i}',
+                    'url': f'https://www.youtube.com/watch?v={video_id}',
+                    'duration': 30,
+                })
+        return {'title': f'Benchmark playlist ({size})', 'entries': entries}
+
+    def extract_info(self, profile, url, *, params=None, download=False):
+        """Заменяет YTDLPool.extract_info (блокирующий вызов, как и настоящий)."""
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+
+        if url.startswith('ytsearch1:'):
+            video_id = hashlib.sha1(url.encode()).hexdigest()[:11]
+            return {'entries': [self.info(video_id)]}
+
+        query = parse_qs(urlparse(url).query)
+        if 'list' in query:
+            params = params or {}
+            start = params.get('playliststart', 1)
+            end = params.get('playlistend', self.page_size)
+            return self.playlist_page(int(query['size'][0]), start, end)
+
+        return self.info(query['v'][0])
+
+
+class FakeChannel:
+    """Текстовый или голосовой канал, который ничего не отправляет."""
+
+    def __init__(self, channel_id):
+        self.id = channel_id
+
+    async def send(self, content):
+        return None
+
+
+class FakeVoiceClient:
+    """Голосовой клиент, который читает кадры источника в отдельном потоке, как discord.py."""
+
+    def __init__(self, loop, *, realtime, encoder=None):
+        self.channel = FakeChannel(1)
+        self.source = None
+        self.frames = 0
+        self.first_frame = asyncio.Event()
+        self.first_frame_at = None
+        self._loop = loop
+        self._realtime = realtime
+        self._encoder = encoder
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def play(self, source, *, after=None):
+        self.source = source
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, args=(source, after), daemon=True)
+        self._thread.start()
+
+    def _run(self, source, after):
+        next_time = time.perf_counter()
+        while not self._stopped.is_set():
+            data = source.read()
+            if not data:
+                break
+
+            if self.first_frame_at is None:
+                self.first_frame_at = time.perf_counter()
+                self._loop.call_soon_threadsafe(self.first_frame.set)
+            self.frames += 1
+
+            # Как и настоящий клиент, кодируем PCM в Opus
+            if self._encoder is not None and not source.is_opus():
+                self._encoder.encode(data, self._encoder.SAMPLES_PER_FRAME)
+
+            if self._realtime:
+                next_time += 0.02
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+        if after:
+            after(None)
+
+    def is_playing(self):
+        return self._thread is not None and self._thread.is_alive() and not self._stopped.is_set()
+
+    def is_paused(self):
+        return False
+
+    def stop(self):
+        self._stopped.set()
+
+
+class FakeGuild:
+    """Гильдия с подставным голосовым клиентом."""
+
+    def __init__(self, guild_id, voice_client):
+        self.id = guild_id
+        self.voice_client = voice_client
+
+
+class FakeBot:
+    """Минимальная замена commands.Bot для плеера."""
+
+    def __init__(self, loop, *, ready=True):
+        self.loop = loop
+        self.closed = False
+        self._ready = asyncio.Event()
+        if ready:
+            self._ready.set()
+
+    async def wait_until_ready(self):
+        await self._ready.wait()
+
+    def is_closed(self):
+        return self.closed
+
+
+class FakeCog:
+    """Замена музыкального модуля: путь к FFmpeg и очистка плеера."""
+
+    def __init__(self, ffmpeg_path):
+        self.ffmpeg_path = ffmpeg_path
+
+    async def cleanup(self, guild):
+        pass
+
+
+class Harness:
+    """Создает плееры на подставных объектах и останавливает их после замера."""
+
+    def __init__(self, ffmpeg_path, encoder):
+        self.ffmpeg_path = ffmpeg_path
+        self.encoder = encoder
+        self._players = []
+        self._guild_ids = iter(range(1, 1 << 30))
+
+    def player(self, *, ready=True, realtime=False, max_queue=None):
+        from player import MusicPlayer
+
+        loop = asyncio.get_running_loop()
+        voice_client = FakeVoiceClient(loop, realtime=realtime, encoder=self.encoder)
+        bot = FakeBot(loop, ready=ready)
+        player = MusicPlayer(bot, FakeGuild(next(self._guild_ids), voice_client), FakeChannel(2), FakeCog(self.ffmpeg_path))
+        if max_queue:
+            player.max_queue = max_queue
+        self._players.append(player)
+        return player
+
+    async def stop(self, player):
+        """Останавливает плеер и дожидается завершения FFmpeg."""
+        player.bot.closed = True
+        player.prefetcher.cancel_all()
+        player.close_feeds()
+        player.cancel_save()
+        player.queue.clear()
+        player._guild.voice_client.stop()
+        # Даем циклу плеера дойти до очистки источника
+        await asyncio.sleep(0.1)
+
+    async def stop_all(self):
+        for player in self._players:
+            await self.stop(player)
+        self._players.clear()
+
+
+async def bench_ttfa(harness, args):
+    """Время от запроса !play до первого аудиокадра."""
+    from resolver import resolve
+
+    if not harness.ffmpeg_path:
+        return {'skipped': 'FFmpeg не найден'}
+
+    samples = []
+    resolve_times = []
+    for i in range(args.iterations):
+        player = harness.player()
+        voice_client = player._guild.voice_client
+
+        started = time.perf_counter()
+        result = await resolve(f'benchmark query {i} {time.time()}')
+        resolved = time.perf_counter()
+        await player.enqueue(result.track)
+        await asyncio.wait_for(voice_client.first_frame.wait(), 30)
+
+        samples.append(voice_client.first_frame_at - started)
+        resolve_times.append(resolved - started)
+        await harness.stop(player)
+
+    return {
+        'iterations': args.iterations,
+        'ttfa_avg_s': sum(samples) / len(samples),
+        'ttfa_min_s': min(samples),
+        'ttfa_max_s': max(samples),
+        'resolve_avg_s': sum(resolve_times) / len(resolve_times),
+    }
+
+
+async def bench_playlist(harness, args, extractor):
+    """Скорость добавления плейлистов разного размера в очередь."""
+    from resolver import resolve
+    from playlist_feed import PlaylistFeed
+
+    results = {}
+    for size in args.playlist_sizes:
+        # Плеер не начинает воспроизведение, замеряется только загрузка плейлиста
+        player = harness.player(ready=False, max_queue=size)
+        calls_before = extractor.calls
+
+        started = time.perf_counter()
+        result = await resolve(f'https://www.youtube.com/playlist?list=BENCH{size}&size={size}&t={time.time()}')
+        feed = PlaylistFeed(result)
+        await player.add_feed(feed)
+        elapsed = time.perf_counter() - started
+
+        results[str(size)] = {
+            'tracks': feed.added,
+            'seconds': elapsed,
+            'tracks_per_s': feed.added / elapsed if elapsed else None,
+            'extractions': extractor.calls - calls_before,
+        }
+        await harness.stop(player)
+
+    return results
+
+
+async def bench_cpu(harness, args):
+    """Загрузка CPU на гильдию при одновременном воспроизведении в N гильдиях."""
+    from resolver import resolve
+
+    if not harness.ffmpeg_path:
+        return {'skipped': 'FFmpeg не найден'}
+
+    players = [harness.player(realtime=True) for _ in range(args.players)]
+    for i, player in enumerate(players):
+        result = await resolve(f'benchmark cpu {i} {time.time()}')
+        await player.enqueue(result.track)
+    await asyncio.gather(*(
+        asyncio.wait_for(player._guild.voice_client.first_frame.wait(), 30) for player in players
+    ))
+
+    self_before = resource.getrusage(resource.RUSAGE_SELF)
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    wall_before = time.perf_counter()
+    frames_before = sum(player._guild.voice_client.frames for player in players)
+
+    await asyncio.sleep(args.duration)
+
+    wall = time.perf_counter() - wall_before
+    frames = sum(player._guild.voice_client.frames for player in players) - frames_before
+    self_after = resource.getrusage(resource.RUSAGE_SELF)
+    # Время CPU процессов FFmpeg учитывается только после их завершения
+    for player in players:
+        await harness.stop(player)
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    def cpu(before, after):
+        return (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+
+    bot_cpu = cpu(self_before, self_after)
+    ffmpeg_cpu = cpu(children_before, children_after)
+    return {
+        'players': args.players,
+        'seconds': wall,
+        'frames_per_s': frames / wall,
+        'opus_encode': harness.encoder is not None,
+        'bot_cpu_per_guild_pct': 100 * bot_cpu / wall / args.players,
+        'ffmpeg_cpu_per_guild_pct': 100 * ffmpeg_cpu / wall / args.players,
+    }
+
+
+async def bench_memory(harness, args, extractor):
+    """Память, занимаемая одним треком в очереди."""
+    from track import Track
+    from track_queue import TrackQueue
+
+    count = args.memory_tracks
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+
+    queue = TrackQueue()
+    page = extractor.playlist_page(count, 1, count)
+    for entry in page['entries']:
+        if 'url' in entry:
+            queue.append(Track.from_entry(entry))
+    # Записи плейлиста после создания треков не хранятся
+    del page, entry
+
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    traced = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    return {
+        'tracks': len(queue),
+        'traced_bytes_per_track': traced / len(queue),
+        'estimated_bytes_per_track': queue.memory_size() / len(queue),
+    }
+
+
+def load_encoder():
+    """Создает кодировщик Opus, если библиотека opus доступна."""
+    import discord
+
+    try:
+        if not discord.opus.is_loaded():
+            discord.opus._load_default()
+        return discord.opus.Encoder()
+    except Exception:
+        return None
+
+
+async def run(args, workdir):
+    from config import PLAYLIST_PAGE_SIZE
+    from ytdl_pool import ytdl_pool
+
+    audio_path = os.path.join(workdir, 'tone.wav')
+    write_tone(audio_path, max(int(args.duration) + 10, 30))
+    server = start_http_server(workdir)
+    audio_url = f'http://127.0.0.1:{server.server_address[1]}/tone.wav'
+
+    extractor = FakeExtractor(
+        audio_url,
+        latency=args.extract_latency,
+        incomplete_ratio=args.incomplete_ratio,
+        page_size=PLAYLIST_PAGE_SIZE
+    )
+    # Пул yt-dlp отдает подставные данные вместо обращения к YouTube
+    ytdl_pool.extract_info = extractor.extract_info
+
+    harness = Harness(shutil.which('ffmpeg'), load_encoder())
+    results = {}
+    try:
+        for name in args.only:
+            print(f"Замер: {name}", file=sys.stderr)
+            if name == 'ttfa':
+                results[name] = await bench_ttfa(harness, args)
+            elif name == 'playlist':
+                results[name] = await bench_playlist(harness, args, extractor)
+            elif name == 'cpu':
+                results[name] = await bench_cpu(harness, args)
+            elif name == 'memory':
+                results[name] = await bench_memory(harness, args, extractor)
+    finally:
+        await harness.stop_all()
+        server.shutdown()
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'ffmpeg': harness.ffmpeg_path,
+        'extract_latency_s': args.extract_latency,
+        'benchmarks': results,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Замеры производительности музыкального бота")
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=list(BENCHMARKS),
+                        help="какие замеры выполнить")
+    parser.add_argument('--output', help="файл для результатов JSON (по умолчанию - стандартный вывод)")
+    parser.add_argument('--iterations', type=int, default=5, help="повторов замера времени до первого кадра")
+    parser.add_argument('--playlist-sizes', type=int, nargs='+', default=[100, 1000], help="размеры плейлистов")
+    parser.add_argument('--players', type=int, default=4, help="число одновременных плееров для замера CPU")
+    parser.add_argument('--duration', type=float, default=10.0, help="длительность замера CPU (секунды)")
+    parser.add_argument('--memory-tracks', type=int, default=2000, help="число треков для замера памяти")
+    parser.add_argument('--extract-latency', type=float, default=0.05,
+                        help="имитируемая задержка одного извлечения (секунды)")
+    parser.add_argument('--incomplete-ratio', type=float, default=0.1,
+                        help="доля записей плейлиста, требующих отдельного извлечения")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+
+    # Модули бота создают базы SQLite в текущем каталоге - работаем во временном,
+    # чтобы замеры не трогали кэши бота и не зависели от них
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        results = asyncio.run(run(args, workdir))
+
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
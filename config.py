@@ -4,21 +4,21 @@
 """
 
 import os
-import ssl
+import logging
 import shutil
-import platform
-import certifi
 
 # Настройка команд
 COMMAND_PREFIX = '!'
 BOT_DESCRIPTION = 'Музыкальный бот для Discord'
 
+log = logging.getLogger(__name__)
+
 # Настройка FFmpeg
 def find_ffmpeg():
     """Находит путь к исполняемому файлу FFmpeg."""
     ffmpeg_path_in_system = shutil.which("ffmpeg")
     if ffmpeg_path_in_system:
-        print(f"✅ FFmpeg найден в PATH: {ffmpeg_path_in_system}")
+        log.info("FFmpeg найден в PATH: %s", ffmpeg_path_in_system)
         return ffmpeg_path_in_system
     
     # Проверка стандартных путей установки
@@ -30,34 +30,15 @@ def find_ffmpeg():
     
     for path in fallback_paths:
         if os.path.exists(path):
-            print(f"✅ FFmpeg найден по пути: {path}")
+            log.info("FFmpeg найден по пути: %s", path)
             return path
     
-    print("❌ ВНИМАНИЕ: FFmpeg не найден!")
-    print("Пожалуйста, установите FFmpeg согласно инструкции в README.md")
+    log.warning("FFmpeg не найден! Установите FFmpeg согласно инструкции в README.md")
     return "ffmpeg"  # Возвращаем базовое имя как последнюю надежду
 
 # Настройка SSL
-def configure_ssl():
-    """Настраивает SSL сертификаты и контекст для безопасных соединений."""
-    # Выводим информацию о системе для отладки
-    print(f"Python версия: {platform.python_version()}")
-    print(f"Операционная система: {platform.system()} {platform.release()}")
-    print(f"SSL версия: {ssl.OPENSSL_VERSION}")
-    print(f"Путь к сертификатам: {certifi.where()}")
-    
-    # Создаем безопасный SSL контекст с сертификатами certifi
-    ssl_context = ssl.create_default_context()
-    ssl_context.load_verify_locations(certifi.where())
-    
-    # Для устранения проблем с некоторыми соединениями
-    ssl_context.check_hostname = False
-    ssl_context.verify_mode = ssl.CERT_NONE
-    
-    # Устанавливаем контекст по умолчанию для всех HTTPS соединений
-    ssl._create_default_https_context = ssl._create_unverified_context
-    
-    return ssl_context
+# Проверять сертификаты HTTPS в соединениях yt-dlp (общий SSL-контекст, см. connection.py)
+SSL_VERIFY = False
 
 # Настройки yt-dlp
 YTDL_FORMAT_OPTIONS = {
@@ -65,7 +46,7 @@ YTDL_FORMAT_OPTIONS = {
     'outtmpl': '%(extractor)s-%(id)s-%(title)s.%(ext)s',
     'restrictfilenames': True,
     'noplaylist': False,  # Разрешаем плейлисты
-    'nocheckcertificate': True,
+    'nocheckcertificate': not SSL_VERIFY,
     'ignoreerrors': False,  # Изменено для обнаружения ошибок в плейлистах
     'logtostderr': False,
     'quiet': True,
@@ -81,22 +62,136 @@ YTDL_FORMAT_OPTIONS = {
     'skip_download': False,
 }
 
+# Сколько записей плейлиста извлекается за один запрос (плейлист читается страницами)
+PLAYLIST_PAGE_SIZE = 100
+
 # Настройки для получения данных о плейлисте
 YTDL_PLAYLIST_OPTIONS = YTDL_FORMAT_OPTIONS.copy()
 YTDL_PLAYLIST_OPTIONS.update({
     'extract_flat': 'in_playlist',  # Режим для определения плейлиста
     'dump_single_json': True,
     'noplaylist': False,  # Важно: разрешаем обработку плейлистов
-    'playlistend': 100,    # Ограничиваем количество треков для анализа
+    'playlistend': PLAYLIST_PAGE_SIZE,    # Первый запрос возвращает только первую страницу
     'ignore_no_formats_error': True,
 })
 
+# Настройки пула экземпляров yt-dlp
+YTDL_POOL_SIZE = 4  # Количество экземпляров YoutubeDL на каждый профиль настроек
+YTDL_POOL_MAX_USES = 200  # После стольких извлечений экземпляр пересоздается
+
+# Настройки планировщика извлечения
+EXTRACTION_WORKERS = 4  # Количество потоков для вызовов yt-dlp
+EXTRACTION_GUILD_LIMIT = 2  # Максимум одновременных извлечений для одной гильдии
+EXTRACTION_MAX_PENDING = 50  # Максимум задач в очереди, после чего бот отвечает «занят»
+
+# Настройки обработки плейлистов
+PLAYLIST_RESOLVE_CONCURRENCY = 4  # Сколько записей плейлиста без ссылки или названия извлекается одновременно
+PLAYLIST_PROGRESS_INTERVAL = 2.0  # Минимальный интервал между обновлениями сообщения о прогрессе (секунды)
+PLAYLIST_PAGE_RETRY_DELAY = 5  # Пауза перед повторным запросом страницы, если извлечение перегружено
+
+# Настройки кэша метаданных
+CACHE_DB_PATH = 'bot_cache.sqlite3'  # Файл базы данных SQLite для кэша
+METADATA_CACHE_TTL = 7 * 24 * 3600  # Срок хранения метаданных и результатов поиска (секунды)
+METADATA_CACHE_MAX_ENTRIES = 10000  # Максимум треков в кэше, лишние вытесняются (LRU)
+
 # Настройки FFmpeg
 FFMPEG_OPTIONS = {
     'options': '-vn',
     'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5'
 }
 
+# Настройки FFmpeg для файлов из локального аудиокэша
+LOCAL_FFMPEG_OPTIONS = {
+    'options': '-vn',
+    'before_options': ''
+}
+
+# Ограничение процессов FFmpeg во всем процессе бота
+FFMPEG_MAX_PROCESSES = 64  # Максимум одновременно запущенных процессов FFmpeg (воспроизведение, общие потоки, кэш)
+FFMPEG_SLOT_TIMEOUT = 10  # Сколько секунд запуск ждет свободного места, прежде чем трек будет отложен
+FFMPEG_REAP_INTERVAL = 30  # Как часто завершаются процессы гильдий, у которых больше нет плеера (секунды)
+FFMPEG_ORPHAN_GRACE = 15  # Процесс моложе этого срока (секунды) не считается осиротевшим
+
+# Настройки локального аудиокэша (треки сохраняются на диск в формате Ogg/Opus)
+AUDIO_CACHE_DIR = 'audio_cache'  # Каталог для файлов кэша
+AUDIO_CACHE_MAX_BYTES = 2 * 1024 ** 3  # Максимальный размер кэша (байты)
+AUDIO_CACHE_MIN_PLAYS = 3  # После скольких воспроизведений трек сохраняется на диск
+AUDIO_CACHE_EVICTION = 'lru'  # Политика вытеснения: 'lru' или 'lfu'
+AUDIO_CACHE_WORKERS = 1  # Сколько треков сохраняется одновременно
+
+# Нормализация громкости: громкость трека (EBU R128) измеряется один раз в фоне,
+# при следующих воспроизведениях трек приводится к целевой громкости
+LOUDNESS_ENABLED = True
+LOUDNESS_TARGET = -14.0  # Целевая интегральная громкость (LUFS)
+LOUDNESS_MAX_BOOST = 6.0  # Максимальное усиление тихих треков (дБ)
+LOUDNESS_WORKERS = 1  # Сколько треков измеряется одновременно
+
+# Режим воспроизведения:
+# 'pcm'  - FFmpeg декодирует в PCM, громкость и кодирование в Opus выполняет бот
+# 'opus' - для потоков Opus бот отдает готовые пакеты (копирование потока при громкости 1.0,
+#          иначе громкость применяет FFmpeg); остальные кодеки воспроизводятся через PCM
+PLAYBACK_MODE = 'pcm'
+OPUS_BITRATE = 128  # Битрейт (кбит/с), если FFmpeg перекодирует поток в Opus
+
+# Обработка PCM на стороне бота (режим 'pcm'): громкость, нарастание, затухание, наложение треков
+DSP_BLOCK_FRAMES = 10  # Сколько кадров по 20 мс читается и обрабатывается за один раз
+DSP_FADE_IN = 0.3  # Плавное нарастание громкости при запуске трека или перемотке (секунды, 0 - выключено)
+DSP_FADE_OUT = 0  # Плавное затухание перед концом трека (секунды, 0 - выключено)
+DSP_CROSSFADE = 0  # Наложение начала следующего трека на конец текущего (секунды, 0 - выключено)
+DSP_CROSSFADE_PREPARE = 10  # За сколько секунд до наложения запускается FFmpeg следующего трека
+READAHEAD_SECONDS = 2  # Сколько секунд PCM отдельный поток читает из FFmpeg заранее (0 - выключено)
+
+# Общий поток для гильдий, одновременно играющих один трек (только в режиме 'opus')
+FANOUT_ENABLED = True
+FANOUT_BUFFER_SECONDS = 30  # На сколько секунд FFmpeg опережает самую быструю гильдию и насколько можно от нее отстать
+FANOUT_JOIN_WINDOW = 5  # Сколько первых секунд трека к общему потоку могут подключиться другие гильдии
+FANOUT_READ_TIMEOUT = 10  # Сколько секунд читатель ждет новых данных, прежде чем завершить трек
+
+# Настройки запуска в нескольких процессах (launcher.py)
+SHARD_COUNT = 0  # Общее число шардов Discord (0 - число, рекомендованное Discord)
+SHARD_WORKERS = 0  # Число рабочих процессов (0 - по числу ядер CPU, но не больше числа шардов)
+WORKER_START_DELAY = 5  # Пауза между запусками процессов, чтобы не превысить лимит подключений к шлюзу (секунды)
+WORKER_RESTART_DELAY = 5  # Начальная пауза перед перезапуском упавшего процесса (секунды)
+WORKER_RESTART_MAX_DELAY = 300  # Максимальная пауза перед перезапуском при повторных падениях (секунды)
+SHARD_STATS_DB_PATH = 'bot_shards.sqlite3'  # Файл SQLite для общей статистики процессов
+SHARD_STATS_INTERVAL = 30  # Как часто процесс публикует статистику (секунды)
+
+# Настройки метрик (текстовый формат Prometheus по адресу http://METRICS_HOST:METRICS_PORT/metrics)
+METRICS_ENABLED = True
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9108  # Процессы launcher.py используют порты METRICS_PORT + номер процесса
+METRICS_UPDATE_INTERVAL = 5  # Как часто обновляются показатели гильдий (секунды)
+
+# Настройки сохранения состояния плееров между перезапусками
+STATE_DB_PATH = 'bot_state.sqlite3'  # Файл базы данных SQLite для состояния
+STATE_MAX_AGE = 24 * 3600  # Состояние старше этого срока (секунды) при запуске не восстанавливается
+STATE_SAVE_DELAY = 1.0  # Задержка сохранения после изменения: изменения подряд сохраняются одной записью
+STATE_SAVE_INTERVAL = 15  # Как часто сохранять позицию во время воспроизведения (секунды)
+STATE_RESTORE_CONCURRENCY = 3  # Сколько гильдий восстанавливается одновременно после запуска
+
 # Настройки плеера
 PLAYER_TIMEOUT = 180  # Тайм-аут в секундах перед автоматическим отключением
 DEFAULT_VOLUME = 0.5  # Громкость по умолчанию (0.0 - 1.0)
+QUEUE_PAGE_SIZE = 10  # Количество треков на одной странице !queue
+MAX_QUEUE_LENGTH = 500  # Максимум треков в очереди гильдии, плейлисты дополняют очередь по мере воспроизведения
+GUILD_MAX_QUEUE_LENGTH = {}  # Лимит очереди для отдельных гильдий: {ID гильдии: лимит}
+
+# Восстановление оборвавшегося потока (трек продолжается с позиции обрыва)
+STREAM_RECOVERY_ATTEMPTS = 3  # Сколько раз восстанавливать поток одного трека
+STREAM_RECOVERY_MARGIN = 5  # Завершение ближе этого числа секунд к концу трека считается нормальным
+
+# Настройки предзагрузки следующих треков
+PREFETCH_DEPTH = 2  # Количество треков очереди, для которых поток получается заранее
+PREFETCH_EXPIRY_MARGIN = 600  # За сколько секунд до истечения URL потока он считается устаревшим
+STREAM_URL_TTL = 3600  # Срок действия URL потока, если источник его не сообщает
+
+# Настройки журнала
+LOG_LEVEL = 'INFO'  # Уровень журнала по умолчанию
+LOG_LEVELS = {  # Уровни отдельных модулей: {имя журнала: уровень}
+    'discord': 'WARNING',
+    'yt_dlp': 'WARNING',  # Вывод yt-dlp (передается через адаптер журнала)
+}
+LOG_FORMAT = '%(asctime)s %(levelname)-8s %(processName)s %(name)s: %(message)s'
+LOG_FILE = None  # Файл журнала в дополнение к консоли (None - только консоль)
+LOG_RATE_LIMIT = 5  # Сколько одинаковых сообщений пропускается за период, остальные подавляются
+LOG_RATE_PERIOD = 60  # Период ограничения повторяющихся сообщений (секунды)
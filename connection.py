@@ -0,0 +1,69 @@
+"""
+Модуль сетевых соединений yt-dlp.
+Все экземпляры YoutubeDL пула используют общий, явно настроенный SSL-контекст
+вместо подмены глобального ssl._create_default_https_context, а HTTP-сессии
+экземпляров держат соединения открытыми (keep-alive) между извлечениями.
+"""
+
+import logging
+import platform
+import ssl
+import threading
+import certifi
+from config import SSL_VERIFY
+
+log = logging.getLogger(__name__)
+
+
+def create_ssl_context(verify=SSL_VERIFY, legacy=False):
+    """Создает SSL-контекст для соединений yt-dlp (сертификаты certifi)."""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = verify
+    context.verify_mode = ssl.CERT_REQUIRED if verify else ssl.CERT_NONE
+    if verify:
+        context.load_verify_locations(certifi.where())
+
+    # Некоторые серверы отклоняют соединения без ALPN
+    context.set_alpn_protocols(['http/1.1'])
+
+    if legacy:
+        # Старые серверы без поддержки безопасного пересогласования (--legacy-server-connect)
+        context.options |= getattr(ssl, 'OP_LEGACY_SERVER_CONNECT', 0x4)
+        context.set_ciphers('DEFAULT')
+    else:
+        context.minimum_version = ssl.TLSVersion.TLSv1_2
+
+    return context
+
+
+class SharedSSLContexts:
+    """Общие SSL-контексты для обработчиков запросов всех экземпляров yt-dlp."""
+
+    def __init__(self, verify=SSL_VERIFY):
+        self._verify = verify
+        self._contexts = {}  # legacy -> контекст
+        self._lock = threading.Lock()
+
+    def get(self, legacy_ssl_support=None):
+        """Возвращает общий контекст; подходит как замена RequestHandler._make_sslcontext."""
+        legacy = bool(legacy_ssl_support)
+        with self._lock:
+            context = self._contexts.get(legacy)
+            if context is None:
+                context = self._contexts[legacy] = create_ssl_context(self._verify, legacy)
+                log.debug("Создан SSL-контекст (проверка сертификатов: %s, legacy: %s, %s, Python %s, %s)",
+                          self._verify, legacy, ssl.OPENSSL_VERSION, platform.python_version(), platform.system())
+            return context
+
+    def install(self, ytdl):
+        """Подключает общий контекст к обработчикам запросов экземпляра YoutubeDL.
+
+        Вызывается до первого запроса: обработчики создают HTTP-сессии (и берут для них контекст) лениво.
+        """
+        for handler in ytdl._request_director.handlers.values():
+            if hasattr(handler, '_make_sslcontext'):
+                handler._make_sslcontext = self.get
+
+
+# Общие SSL-контексты для всего бота
+ssl_contexts = SharedSSLContexts()
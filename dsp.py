@@ -0,0 +1,176 @@
+"""
+Модуль обработки PCM перед отправкой в голосовой канал.
+PCM читается из FFmpeg блоками по несколько кадров, громкость, плавное нарастание,
+затухание и наложение соседних треков применяются ко всему блоку векторными
+операциями NumPy, а голосовому клиенту блок отдается кадрами по 20 мс.
+Вывод FFmpeg заранее читается отдельным потоком в буфер (модуль readahead).
+"""
+
+import numpy as np
+import discord
+from discord.opus import Encoder
+from config import DSP_BLOCK_FRAMES, DSP_FADE_IN, DSP_FADE_OUT, READAHEAD_SECONDS
+from readahead import ReadAheadBuffer
+
+# Формат PCM, который FFmpegPCMAudio отдает голосовому клиенту: 48 кГц, стерео, 16 бит
+SAMPLE_RATE = Encoder.SAMPLING_RATE
+CHANNELS = Encoder.CHANNELS
+SAMPLES_PER_FRAME = Encoder.SAMPLES_PER_FRAME
+FRAME_SIZE = Encoder.FRAME_SIZE
+SAMPLE_SIZE = FRAME_SIZE // SAMPLES_PER_FRAME  # Байт на сэмпл всех каналов
+
+# Максимальная громкость (как у discord.PCMVolumeTransformer)
+MAX_VOLUME = 2.0
+
+
+class DSPSource(discord.AudioSource):
+    """Источник PCM с блочной обработкой: громкость, нарастание, затухание, наложение следующего трека.
+
+    start и duration (секунды) задают положение источника в треке: по ним рассчитываются
+    нарастание от точки запуска и затухание перед концом трека.
+    """
+
+    def __init__(self, original, *, volume=1.0, start=0.0, duration=0, block_frames=DSP_BLOCK_FRAMES,
+                 fade_in=DSP_FADE_IN, fade_out=DSP_FADE_OUT, readahead=READAHEAD_SECONDS):
+        if not isinstance(original, discord.AudioSource):
+            raise TypeError(f'expected AudioSource not {original.__class__.__name__}.')
+        if original.is_opus():
+            raise discord.ClientException('AudioSource must not be Opus encoded.')
+
+        self.original = original
+        self.volume = volume
+        self._block_size = block_frames * FRAME_SIZE
+        self._start = int(start * SAMPLE_RATE)  # Сэмпл трека, с которого начат источник
+        self._offset = self._start  # Номер следующего прочитанного сэмпла от начала трека
+        self._end = int(duration * SAMPLE_RATE) if duration else None
+        self._fade_in = int(fade_in * SAMPLE_RATE)
+        self._fade_out = int(fade_out * SAMPLE_RATE)
+        self._block = b''  # Обработанный блок, который отдается кадрами
+        self._block_pos = 0
+        self._raw = bytearray()  # Остаток PCM источников, которые отдают данные только кадрами
+        self._next = None  # Источник следующего трека при наложении
+        self._mix_from = None  # Сэмпл этого трека, с которого начинается наложение
+        self.mixed_samples = 0  # Сэмплы этого источника, уже выданные через наложение на предыдущий трек
+
+        # FFmpegPCMAudio: канал читается заранее, чтобы поток отправки не ждал FFmpeg.
+        # В буфере лежит необработанный PCM, поэтому изменение громкости слышно сразу
+        stdout = getattr(original, '_stdout', None)
+        self._readahead = None
+        if stdout is not None and readahead > 0:
+            self._readahead = ReadAheadBuffer(
+                stdout, int(readahead * SAMPLE_RATE) * SAMPLE_SIZE, chunk_size=self._block_size
+            )
+
+    @property
+    def volume(self):
+        """Громкость (1.0 - без изменений)."""
+        return self._volume
+
+    @volume.setter
+    def volume(self, value):
+        self._volume = min(max(value, 0.0), MAX_VOLUME)
+
+    def read(self):
+        if self._block_pos >= len(self._block):
+            self._block = self._next_block()
+            self._block_pos = 0
+            if not self._block:
+                return b''
+
+        frame = self._block[self._block_pos:self._block_pos + FRAME_SIZE]
+        self._block_pos += FRAME_SIZE
+        # Последний кадр потока может быть неполным: дополняем его тишиной
+        return frame.ljust(FRAME_SIZE, b'\0')
+
+    def is_opus(self):
+        return False
+
+    def cleanup(self):
+        if self._readahead is not None:
+            self._readahead.close()
+        self.original.cleanup()
+
+    def crossfade_into(self, source, seconds):
+        """Накладывает начало source на последние seconds секунд этого трека.
+
+        Когда этот источник закончится, source продолжает воспроизведение с места, где закончилось наложение.
+        """
+        length = int(seconds * SAMPLE_RATE)
+        if self._end is None or length <= 0:
+            return False
+
+        self._mix_from = max(self._end - length, self._offset)
+        self._fade_out = max(self._fade_out, self._end - self._mix_from)
+        source._fade_in = self._end - self._mix_from
+        self._next = source
+        return True
+
+    def _read_raw(self, size):
+        """Читает до size байт PCM из исходного источника."""
+        stdout = getattr(self.original, '_stdout', None)
+        if self._readahead is not None:
+            data = self._readahead.read(size)
+        elif stdout is not None:
+            # FFmpegPCMAudio: один вызов чтения канала на блок вместо вызова на каждый кадр
+            data = stdout.read(size)
+        else:
+            # Остальные источники отдают PCM только кадрами
+            while len(self._raw) < size:
+                frame = self.original.read()
+                if not frame:
+                    break
+                self._raw += frame
+            data = bytes(self._raw[:size])
+            del self._raw[:size]
+        # Неполный сэмпл в конце потока отбрасываем
+        return data[:len(data) - len(data) % SAMPLE_SIZE]
+
+    def _gain(self, first, count):
+        """Огибающая громкости для сэмплов first..first+count или None, если она не нужна."""
+        fade_in = self._fade_in and first - self._start < self._fade_in
+        fade_out = self._fade_out and self._end is not None and first + count > self._end - self._fade_out
+        if not (fade_in or fade_out):
+            return None
+
+        index = np.arange(first, first + count, dtype=np.float32)
+        gain = np.ones(count, dtype=np.float32)
+        if fade_in:
+            gain *= np.clip((index - self._start) / self._fade_in, 0.0, 1.0)
+        if fade_out:
+            gain *= np.clip((self._end - index) / self._fade_out, 0.0, 1.0)
+        return gain
+
+    def _process(self, size):
+        """Читает и обрабатывает до size байт; возвращает сэмплы float32 (сэмплы x каналы) или None."""
+        data = self._read_raw(size)
+        if not data:
+            return None
+
+        samples = np.frombuffer(data, dtype=np.int16).reshape(-1, CHANNELS).astype(np.float32)
+        gain = self._gain(self._offset, len(samples))
+        self._offset += len(samples)
+
+        if gain is None:
+            if self._volume != 1.0:
+                samples *= self._volume
+        else:
+            samples *= (gain * self._volume)[:, None]
+        return samples
+
+    def _next_block(self):
+        """Готовит следующий блок PCM для выдачи кадрами."""
+        first = self._offset
+        samples = self._process(self._block_size)
+        if samples is None:
+            return b''
+
+        # Наложение начала следующего трека на конец этого
+        if self._next is not None and first + len(samples) > self._mix_from:
+            skip = max(self._mix_from - first, 0)
+            incoming = self._next._process((len(samples) - skip) * SAMPLE_SIZE)
+            if incoming is not None:
+                samples[skip:skip + len(incoming)] += incoming
+                self._next.mixed_samples += len(incoming)
+
+        np.clip(samples, -32768, 32767, out=samples)
+        return samples.astype(np.int16).tobytes()
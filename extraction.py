@@ -0,0 +1,206 @@
+"""
+Модуль планировщика извлечения yt-dlp.
+Выполняет блокирующие вызовы extract_info в отдельном пуле потоков
+с ограничением на гильдию и приоритетом интерактивных запросов.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import EXTRACTION_WORKERS, EXTRACTION_GUILD_LIMIT, EXTRACTION_MAX_PENDING
+from metrics import EXTRACTIONS, EXTRACTION_WAIT, EXTRACTION_RUN
+
+# Приоритеты задач: чем меньше число, тем раньше выполняется задача
+PRIORITY_INTERACTIVE = 0  # Пользователь ждет ответа (!play, начало трека)
+PRIORITY_BULK = 1  # Фоновая работа (плейлисты, предзагрузка)
+
+# Названия приоритетов для метрик
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: 'interactive', PRIORITY_BULK: 'bulk'}
+
+
+class ExtractorBusyError(Exception):
+    """Очередь извлечения переполнена, запрос нужно повторить позже."""
+
+
+class ExtractionJob:
+    """Задача извлечения в очереди планировщика."""
+
+    __slots__ = ('priority', 'seq', 'guild_id', 'func', 'future', 'submitted_at')
+
+    def __init__(self, priority, seq, guild_id, func, future, submitted_at):
+        self.priority = priority
+        self.seq = seq
+        self.guild_id = guild_id
+        self.func = func
+        self.future = future
+        self.submitted_at = submitted_at
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class GuildSlots:
+    """Места для одновременных задач одной гильдии: освободившееся место получает задача с высшим приоритетом."""
+
+    __slots__ = ('limit', 'running', 'pending', '_waiters')
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.running = 0  # Задачи гильдии, занявшие место
+        self.pending = 0  # Задачи гильдии, ожидающие или выполняющиеся
+        self._waiters = []  # Куча (задача, future) задач, ожидающих места
+
+    async def acquire(self, job):
+        """Ждет свободного места для задачи job."""
+        if self.running < self.limit and not self._waiters:
+            self.running += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (job, waiter)
+        heapq.heappush(self._waiters, entry)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Место уже передано этой задаче - отдаем его следующей
+                self.release()
+            else:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            raise
+
+    def release(self):
+        """Освобождает место и передает его ожидающей задаче с высшим приоритетом."""
+        self.running -= 1
+        while self._waiters and self.running < self.limit:
+            _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                self.running += 1
+                waiter.set_result(None)
+
+
+class ExtractionStats:
+    """Статистика времени ожидания и выполнения задач извлечения."""
+
+    def __init__(self):
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.total_run = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait, run, failed):
+        """Учитывает завершенную задачу."""
+        if failed:
+            self.failed += 1
+        else:
+            self.completed += 1
+        self.total_wait += wait
+        self.total_run += run
+        self.max_wait = max(self.max_wait, wait)
+
+    def averages(self):
+        """Возвращает среднее время ожидания и выполнения в секундах."""
+        jobs = self.completed + self.failed
+        if not jobs:
+            return 0.0, 0.0
+        return self.total_wait / jobs, self.total_run / jobs
+
+
+class ExtractionScheduler:
+    """Планировщик задач извлечения с собственным пулом потоков."""
+
+    def __init__(self, *, workers=EXTRACTION_WORKERS, guild_limit=EXTRACTION_GUILD_LIMIT,
+                 max_pending=EXTRACTION_MAX_PENDING):
+        self._workers = workers
+        self._guild_limit = guild_limit
+        self._max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ytdl-extract')
+        self._queue = None  # Создается при первом запуске внутри цикла событий
+        self._tasks = []
+        self._guild_slots = {}  # guild_id -> GuildSlots
+        self._seq = itertools.count()
+        self.pending = 0
+        self.stats = ExtractionStats()
+
+    def _start(self):
+        self._queue = asyncio.PriorityQueue()
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self._workers)]
+
+    async def run(self, func, *, guild_id=None, priority=PRIORITY_INTERACTIVE):
+        """Выполняет блокирующую функцию func в пуле извлечения и возвращает результат."""
+        if self._queue is None:
+            self._start()
+
+        if self.pending >= self._max_pending:
+            self.stats.rejected += 1
+            EXTRACTIONS.inc(result='rejected')
+            raise ExtractorBusyError("Слишком много запросов в очереди извлечения")
+
+        self.pending += 1
+        slot = self._guild_slots.get(guild_id)
+        if slot is None:
+            slot = self._guild_slots[guild_id] = GuildSlots(self._guild_limit)
+        slot.pending += 1
+
+        try:
+            future = asyncio.get_running_loop().create_future()
+            job = ExtractionJob(priority, next(self._seq), guild_id, func, future, time.perf_counter())
+            # Ограничиваем число одновременных задач одной гильдии; внутри гильдии
+            # интерактивная задача получает место раньше фоновых, поставленных до нее
+            await slot.acquire(job)
+            try:
+                await self._queue.put(job)
+                return await future
+            finally:
+                slot.release()
+
+        finally:
+            self.pending -= 1
+            slot.pending -= 1
+            if not slot.pending:
+                self._guild_slots.pop(guild_id, None)
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            job = await self._queue.get()
+            if job.future.cancelled():
+                continue
+
+            started_at = time.perf_counter()
+            wait = started_at - job.submitted_at
+            try:
+                result = await loop.run_in_executor(self._executor, job.func)
+            except Exception as e:
+                self._finish(job, wait, started_at, failed=True)
+                if not job.future.cancelled():
+                    job.future.set_exception(e)
+            else:
+                self._finish(job, wait, started_at, failed=False)
+                if not job.future.cancelled():
+                    job.future.set_result(result)
+
+    def _finish(self, job, wait, started_at, failed):
+        run = time.perf_counter() - started_at
+        self.stats.record(wait, run, failed)
+        
+        priority = PRIORITY_NAMES.get(job.priority, str(job.priority))
+        EXTRACTIONS.inc(result='error' if failed else 'ok')
+        EXTRACTION_WAIT.observe(wait, priority=priority)
+        EXTRACTION_RUN.observe(run, priority=priority)
+
+    def guild_pending(self, guild_id):
+        """Количество задач гильдии, ожидающих или выполняющихся."""
+        slot = self._guild_slots.get(guild_id)
+        return slot.pending if slot else 0
+
+
+# Общий планировщик для всего бота
+extraction_scheduler = ExtractionScheduler()
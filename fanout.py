@@ -0,0 +1,191 @@
+"""
+Модуль общего воспроизведения одного трека в нескольких гильдиях.
+Один процесс FFmpeg заполняет буфер пакетов Opus, а каждая гильдия читает его
+со своей позиции. Прочитанные всеми пакеты удаляются; начало трека хранится
+только первые секунды, пока к потоку могут подключиться другие гильдии.
+Гильдия, отставшая от остальных (пауза), отключается от общего потока и
+продолжает трек собственным процессом FFmpeg, не задерживая остальных.
+"""
+
+import logging
+import threading
+from collections import deque
+import discord
+from config import FANOUT_BUFFER_SECONDS, FANOUT_JOIN_WINDOW, FANOUT_READ_TIMEOUT
+from track import TrackMetadata, FRAME_DURATION
+
+log = logging.getLogger(__name__)
+
+
+class SharedStream:
+    """Общий поток пакетов Opus от одного процесса FFmpeg."""
+
+    def __init__(self, key, source, *, capacity, head, on_close):
+        self.key = key
+        self._source = source
+        self._capacity = capacity  # На сколько пакетов FFmpeg опережает самого быстрого читателя и насколько можно отстать
+        self._head = head  # Сколько первых пакетов хранится для подключения новых читателей
+        self._on_close = on_close
+        self._frames = deque()
+        self._base = 0  # Номер пакета, лежащего в начале буфера
+        self._positions = {}  # Читатель -> номер следующего пакета
+        self._finished = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._produce, daemon=True, name=f'fanout:{key!r}')
+        self._thread.start()
+
+    def attach(self, data):
+        """Создает читателя с первого пакета или возвращает None, если начало уже вытеснено."""
+        with self._condition:
+            if self._closed or self._base > 0:
+                return None
+            reader = SharedStreamReader(self, data)
+            self._positions[reader] = 0
+            return reader
+
+    def read_frame(self, reader):
+        """Возвращает следующий пакет для читателя или b'' по окончании потока или после отключения читателя."""
+        with self._condition:
+            position = self._positions.get(reader)
+            if position is None:
+                return b''
+
+            # Ждем, пока FFmpeg выдаст следующий пакет
+            while position >= self._base + len(self._frames) and not self._finished:
+                if not self._condition.wait(FANOUT_READ_TIMEOUT):
+                    log.warning("Истекло ожидание данных общего потока %r", self.key)
+                    return b''
+
+            if position >= self._base + len(self._frames):
+                return b''
+
+            frame = self._frames[position - self._base]
+            self._positions[reader] = position + 1
+            self._evict()
+            self._condition.notify_all()
+            return frame
+
+    def release(self, reader):
+        """Отключает читателя; последний читатель останавливает FFmpeg."""
+        with self._condition:
+            if self._positions.pop(reader, None) is None:
+                return
+            if self._positions:
+                self._condition.notify_all()
+                return
+            self._closed = True
+            self._condition.notify_all()
+
+        self._source.cleanup()
+        self._on_close(self)
+
+    def _evict(self):
+        """Удаляет пакеты, прочитанные всеми читателями; возвращает позицию самого быстрого (под блокировкой).
+
+        Читатели, отставшие от самого быстрого больше чем на capacity пакетов, отключаются.
+        Пока кто-то из читателей не прошел начало трека, оно хранится для подключения новых читателей.
+        """
+        fastest = max(self._positions.values(), default=self._base)
+        for reader, position in list(self._positions.items()):
+            if fastest - position > self._capacity:
+                # Гильдия на паузе или не успевает читать: она продолжит трек своим процессом FFmpeg
+                del self._positions[reader]
+                reader.detached = True
+                log.info("Отставший читатель отключен от общего потока %r", self.key)
+
+        slowest = min(self._positions.values(), default=self._base)
+        if slowest >= self._head:
+            while self._base < slowest:
+                self._frames.popleft()
+                self._base += 1
+        return fastest
+
+    def _produce(self):
+        """Читает пакеты из FFmpeg в буфер, не обгоняя самого быстрого читателя больше чем на capacity пакетов."""
+        while True:
+            packet = self._source.read()
+
+            with self._condition:
+                if self._closed:
+                    return
+                if not packet:
+                    self._finished = True
+                    self._condition.notify_all()
+                    return
+
+                # FFmpeg читает быстрее реального времени: ждем, пока пакеты заберет хотя бы самый быстрый читатель
+                while self._base + len(self._frames) - self._evict() >= self._capacity and not self._closed:
+                    self._condition.wait()
+
+                self._frames.append(packet)
+                self._condition.notify_all()
+
+
+class SharedStreamReader(TrackMetadata, discord.AudioSource):
+    """Аудио-источник гильдии, читающий общий поток со своей позиции."""
+
+    detached = False  # Читатель отстал и отключен от общего потока: трек нужно продолжить с его позиции
+
+    def __init__(self, stream, data):
+        self._stream = stream
+        self._set_metadata(data)
+
+    def read(self):
+        frame = self._stream.read_frame(self)
+        if frame:
+            self._count_frame()
+        return frame
+
+    def is_opus(self):
+        return True
+
+    def cleanup(self):
+        self._stream.release(self)
+
+
+class FanoutHub:
+    """Реестр общих потоков, доступных для подключения."""
+
+    def __init__(self, buffer_seconds=FANOUT_BUFFER_SECONDS, join_window=FANOUT_JOIN_WINDOW):
+        self._capacity = int(buffer_seconds / FRAME_DURATION)
+        self._head = int(join_window / FRAME_DURATION)
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def attach(self, key, data):
+        """Подключается к уже запущенному общему потоку key или возвращает None."""
+        with self._lock:
+            stream = self._streams.get(key)
+            reader = stream.attach(data) if stream else None
+        if reader is not None:
+            log.debug("Подключение к общему потоку: %s", data.get('title'))
+        return reader
+
+    def open(self, key, factory, data):
+        """Подключается к общему потоку key или запускает новый через factory()."""
+        with self._lock:
+            stream = self._streams.get(key)
+            reader = stream.attach(data) if stream else None
+            if reader is not None:
+                log.debug("Подключение к общему потоку: %s", data.get('title'))
+                return reader
+
+            stream = SharedStream(key, factory(), capacity=self._capacity, head=self._head,
+                                  on_close=self._forget)
+            self._streams[key] = stream
+            return stream.attach(data)
+
+    @property
+    def active_streams(self):
+        """Количество запущенных общих потоков."""
+        return len(self._streams)
+
+    def _forget(self, stream):
+        with self._lock:
+            if self._streams.get(stream.key) is stream:
+                del self._streams[stream.key]
+
+
+# Общий реестр для всего бота
+fanout_hub = FanoutHub()
@@ -0,0 +1,154 @@
+"""
+Модуль контроля процессов FFmpeg.
+Ограничивает число одновременно запущенных процессов FFmpeg во всем процессе бота,
+учитывает их по гильдиям и видам и завершает «осиротевшие» процессы,
+оставшиеся после остановки плеера.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from config import FFMPEG_MAX_PROCESSES, FFMPEG_SLOT_TIMEOUT, FFMPEG_ORPHAN_GRACE
+from extraction import ExtractorBusyError
+
+log = logging.getLogger(__name__)
+
+# Как часто проверяется, не освободилось ли место под новый процесс (секунды)
+SLOT_POLL_INTERVAL = 0.25
+
+# Виды процессов
+KIND_STREAM = 'stream'  # Воспроизведение в одной гильдии
+KIND_FANOUT = 'fanout'  # Общий поток для нескольких гильдий
+KIND_CACHE = 'cache'  # Сохранение трека в аудиокэш
+KIND_ANALYSIS = 'analysis'  # Измерение громкости трека
+
+
+class FFmpegBusyError(ExtractorBusyError):
+    """Достигнут лимит процессов FFmpeg, запуск нужно повторить позже."""
+
+
+class FFmpegProcess:
+    """Запущенный процесс FFmpeg и его владелец."""
+
+    __slots__ = ('process', 'guild_id', 'kind', 'started_at')
+
+    def __init__(self, process, guild_id, kind):
+        self.process = process  # subprocess.Popen или asyncio.subprocess.Process
+        self.guild_id = guild_id
+        self.kind = kind
+        self.started_at = time.monotonic()
+
+    @property
+    def running(self):
+        if hasattr(self.process, 'poll'):
+            # poll() заодно забирает код завершения, не оставляя процесс-зомби
+            return self.process.poll() is None
+        return self.process.returncode is None
+
+    def kill(self):
+        try:
+            self.process.kill()
+        except ProcessLookupError:
+            pass
+
+
+class FFmpegSupervisor:
+    """Учет и ограничение процессов FFmpeg."""
+
+    def __init__(self, limit=FFMPEG_MAX_PROCESSES):
+        self.limit = limit
+        self._processes = {}  # pid -> FFmpegProcess
+        self._reserved = 0  # Места, занятые процессами, которые сейчас запускаются
+        self._lock = threading.Lock()
+
+    def _collect(self):
+        """Забывает завершившиеся процессы (вызывается под блокировкой)."""
+        for pid in [pid for pid, entry in self._processes.items() if not entry.running]:
+            del self._processes[pid]
+
+    def _try_reserve(self):
+        with self._lock:
+            self._collect()
+            if len(self._processes) + self._reserved >= self.limit:
+                return False
+            self._reserved += 1
+            return True
+
+    @asynccontextmanager
+    async def spawn(self, *, timeout=FFMPEG_SLOT_TIMEOUT):
+        """Занимает место под новый процесс на время блока with; запущенный процесс передается в adopt().
+
+        Если место не освободилось за timeout секунд, возбуждает FFmpegBusyError.
+        """
+        deadline = time.monotonic() + timeout
+        while not self._try_reserve():
+            if time.monotonic() >= deadline:
+                raise FFmpegBusyError(f"Запущено максимальное число процессов FFmpeg ({self.limit})")
+            await asyncio.sleep(SLOT_POLL_INTERVAL)
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._reserved -= 1
+
+    def adopt(self, owner, *, guild_id=None, kind=KIND_STREAM):
+        """Берет на учет процесс FFmpeg и возвращает owner.
+
+        owner - аудио-источник discord.py (процесс берется из него) или сам процесс.
+        """
+        process = getattr(owner, '_process', owner)
+        if process is not None and getattr(process, 'pid', None) is not None:
+            with self._lock:
+                self._processes[process.pid] = FFmpegProcess(process, guild_id, kind)
+        return owner
+
+    def kill_guild(self, guild_id):
+        """Завершает все процессы гильдии (плеер остановлен)."""
+        with self._lock:
+            entries = [entry for entry in self._processes.values() if entry.guild_id == guild_id]
+        for entry in entries:
+            if entry.running:
+                entry.kill()
+        return len(entries)
+
+    def reap(self, active_guilds):
+        """Завершает процессы гильдий, у которых больше нет плеера, и забывает завершившиеся."""
+        now = time.monotonic()
+        with self._lock:
+            self._collect()
+            orphans = [
+                entry for entry in self._processes.values()
+                if entry.guild_id is not None and entry.guild_id not in active_guilds
+                and now - entry.started_at > FFMPEG_ORPHAN_GRACE
+            ]
+        for entry in orphans:
+            log.warning("Завершение осиротевшего процесса FFmpeg %s (гильдия %s)", entry.process.pid, entry.guild_id)
+            entry.kill()
+        return len(orphans)
+
+    @property
+    def running(self):
+        """Количество запущенных процессов."""
+        with self._lock:
+            self._collect()
+            return len(self._processes)
+
+    def counts(self):
+        """Количество запущенных процессов по видам."""
+        with self._lock:
+            self._collect()
+            return Counter(entry.kind for entry in self._processes.values())
+
+    def guild_counts(self):
+        """Количество запущенных процессов по гильдиям (без общих потоков и фоновых задач)."""
+        with self._lock:
+            self._collect()
+            return Counter(entry.guild_id for entry in self._processes.values() if entry.guild_id is not None)
+
+
+# Общий контроль процессов FFmpeg для всего бота
+ffmpeg_supervisor = FFmpegSupervisor()
@@ -0,0 +1,190 @@
+"""
+Запуск бота в нескольких процессах.
+Шарды Discord распределяются между рабочими процессами (по AutoShardedBot в каждом),
+а супервизор перезапускает упавшие процессы. Кэши, состояние плееров и статистика
+процессов хранятся в общих базах SQLite.
+"""
+
+import logging
+import multiprocessing
+import os
+import signal
+import time
+import requests
+from config import (
+    SHARD_COUNT, SHARD_WORKERS, WORKER_START_DELAY,
+    WORKER_RESTART_DELAY, WORKER_RESTART_MAX_DELAY, SHARD_STATS_INTERVAL
+)
+
+log = logging.getLogger(__name__)
+
+# Адрес API Discord для получения рекомендованного числа шардов
+GATEWAY_BOT_URL = 'https://discord.com/api/v10/gateway/bot'
+
+# Как часто супервизор проверяет процессы (секунды)
+SUPERVISOR_POLL_INTERVAL = 1.0
+
+# Процесс, проработавший дольше этого срока, считается стабильным и пауза перед перезапуском сбрасывается
+WORKER_STABLE_AFTER = 600
+
+# Как часто супервизор выводит сводную статистику (в интервалах публикации статистики)
+REPORT_EVERY = 10
+
+
+def recommended_shard_count(token):
+    """Запрашивает у Discord рекомендованное число шардов."""
+    response = requests.get(GATEWAY_BOT_URL, headers={'Authorization': f'Bot {token}'}, timeout=15)
+    response.raise_for_status()
+    return response.json()['shards']
+
+
+def split_shards(shard_count, workers):
+    """Делит шарды на workers непрерывных групп примерно одинакового размера."""
+    shard_ids = list(range(shard_count))
+    size, extra = divmod(shard_count, workers)
+    groups = []
+    start = 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        groups.append(shard_ids[start:end])
+        start = end
+    return groups
+
+
+def run_worker(token, worker_id, shard_ids, shard_count):
+    """Точка входа рабочего процесса: запускает бота для своей группы шардов."""
+    # Супервизор сам останавливает процессы, Ctrl+C в консоли не должен ронять их по отдельности
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # Процесс запускается через spawn, поэтому модули бота инициализируются заново в каждом процессе
+    from main import create_bot, setup_hook
+
+    bot = create_bot(shard_ids=shard_ids, shard_count=shard_count)
+    bot.setup_hook = lambda: setup_hook(bot, worker_id=worker_id)
+
+    log.info("Процесс %s запускается (шарды %s)", worker_id, shard_ids)
+    bot.run(token, log_handler=None)
+
+
+class Worker:
+    """Рабочий процесс супервизора и сведения о его перезапусках."""
+
+    __slots__ = ('worker_id', 'shard_ids', 'process', 'started_at', 'restart_delay', 'restart_at')
+
+    def __init__(self, worker_id, shard_ids):
+        self.worker_id = worker_id
+        self.shard_ids = shard_ids
+        self.process = None
+        self.started_at = 0.0
+        self.restart_delay = WORKER_RESTART_DELAY
+        self.restart_at = 0.0  # Когда перезапустить процесс после падения
+
+
+class Supervisor:
+    """Запускает рабочие процессы и перезапускает их при падении."""
+
+    def __init__(self, token, shard_count, workers):
+        self._token = token
+        self._shard_count = shard_count
+        self._context = multiprocessing.get_context('spawn')
+        self._workers = [
+            Worker(worker_id, shard_ids)
+            for worker_id, shard_ids in enumerate(split_shards(shard_count, workers))
+        ]
+        self._stopping = False
+
+    def _start(self, worker):
+        worker.process = self._context.Process(
+            target=run_worker,
+            args=(self._token, worker.worker_id, worker.shard_ids, self._shard_count),
+            name=f'bot-worker-{worker.worker_id}',
+        )
+        worker.process.start()
+        worker.started_at = time.monotonic()
+
+    def _check(self, worker):
+        """Перезапускает процесс, если он завершился, с растущей паузой при повторных падениях."""
+        if worker.process.is_alive():
+            if time.monotonic() - worker.started_at > WORKER_STABLE_AFTER:
+                worker.restart_delay = WORKER_RESTART_DELAY
+            return
+
+        now = time.monotonic()
+        if not worker.restart_at:
+            log.error("Процесс %s завершился с кодом %s, перезапуск через %s с",
+                      worker.worker_id, worker.process.exitcode, worker.restart_delay)
+            worker.restart_at = now + worker.restart_delay
+            worker.restart_delay = min(worker.restart_delay * 2, WORKER_RESTART_MAX_DELAY)
+            return
+
+        if now >= worker.restart_at:
+            worker.restart_at = 0.0
+            self._start(worker)
+
+    def _report(self):
+        """Выводит сводную статистику процессов из общего хранилища."""
+        from shard_stats import shard_stats
+
+        rows = shard_stats.workers()
+        log.info(
+            "Процессов: %d/%d, гильдий: %d, плееров: %d, треков в очередях: %d",
+            len(rows), len(self._workers),
+            sum(row['guilds'] for row in rows),
+            sum(row['players'] for row in rows),
+            sum(row['queued'] for row in rows),
+        )
+
+    def stop(self, *args):
+        """Останавливает все рабочие процессы."""
+        self._stopping = True
+
+    def run(self):
+        """Запускает процессы и следит за ними до остановки."""
+        from shard_stats import shard_stats
+        shard_stats.clear()
+
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+
+        for worker in self._workers:
+            self._start(worker)
+            # Подключения к шлюзу Discord ограничены по частоте, запускаем процессы по очереди
+            time.sleep(WORKER_START_DELAY)
+        log.info("Запущено процессов: %d, шардов: %d", len(self._workers), self._shard_count)
+
+        report_interval = SHARD_STATS_INTERVAL * REPORT_EVERY
+        next_report = time.monotonic() + report_interval
+        while not self._stopping:
+            for worker in self._workers:
+                self._check(worker)
+
+            if time.monotonic() >= next_report:
+                next_report += report_interval
+                self._report()
+
+            time.sleep(SUPERVISOR_POLL_INTERVAL)
+
+        log.info("Остановка процессов...")
+        for worker in self._workers:
+            if worker.process.is_alive():
+                worker.process.terminate()
+        for worker in self._workers:
+            worker.process.join(timeout=10)
+
+
+def main():
+    """Определяет число шардов и процессов и запускает супервизор."""
+    # Импорт main настраивает журнал супервизора; рабочие процессы настраивают его так же при импорте
+    from main import get_token
+
+    token = get_token()
+
+    shard_count = SHARD_COUNT or recommended_shard_count(token)
+    workers = min(SHARD_WORKERS or os.cpu_count() or 1, shard_count)
+    log.info("Шардов: %d, процессов: %d", shard_count, workers)
+
+    Supervisor(token, shard_count, workers).run()
+
+
+if __name__ == "__main__":
+    main()
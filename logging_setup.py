@@ -0,0 +1,130 @@
+"""
+Модуль настройки журнала бота.
+Записи журнала передаются через очередь в отдельный поток, который и пишет их
+в консоль или файл, поэтому потоки извлечения и цикл событий не ждут вывода.
+Повторяющиеся сообщения (например, по каждому треку плейлиста) ограничиваются по частоте.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import re
+import threading
+import time
+from config import (
+    LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_FILE,
+    LOG_RATE_LIMIT, LOG_RATE_PERIOD
+)
+
+# При таком числе отслеживаемых шаблонов из фильтра удаляются истекшие окна
+RATE_LIMIT_MAX_KEYS = 1000
+
+# Идентификатор в сообщениях yt-dlp вида "[youtube] dQw4w9WgXcQ: Downloading webpage"
+YTDL_MESSAGE_ID = re.compile(r'^(\[[^\]]+\]) [^\s:]+:')
+
+_listener = None
+
+
+class RateLimitFilter(logging.Filter):
+    """Пропускает не больше limit одинаковых сообщений за period секунд.
+
+    Сообщения считаются одинаковыми, если совпадают журнал, уровень и шаблон (до подстановки
+    аргументов). Число подавленных сообщений добавляется к первому сообщению следующего окна.
+    Ошибки не ограничиваются.
+    """
+
+    def __init__(self, limit=LOG_RATE_LIMIT, period=LOG_RATE_PERIOD):
+        super().__init__()
+        self._limit = limit
+        self._period = period
+        self._windows = {}  # Ключ сообщения -> [начало окна, пропущено, подавлено]
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        for key in [key for key, window in self._windows.items() if now - window[0] >= self._period]:
+            del self._windows[key]
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR:
+            return True
+
+        key = (record.name, record.levelno, getattr(record, 'rate_key', record.msg))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self._period:
+                suppressed = window[2] if window else 0
+                if window is None and len(self._windows) >= RATE_LIMIT_MAX_KEYS:
+                    self._prune(now)
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.msg = f"{record.msg} (подавлено похожих сообщений: {suppressed})"
+                return True
+
+            if window[1] < self._limit:
+                window[1] += 1
+                return True
+
+            window[2] += 1
+            return False
+
+
+class YTDLLogger:
+    """Адаптер журнала для параметра 'logger' yt-dlp: вывод yt-dlp попадает в журнал 'yt_dlp'."""
+
+    def __init__(self, name='yt_dlp'):
+        self._log = logging.getLogger(name)
+
+    def _write(self, level, msg):
+        if not self._log.isEnabledFor(level):
+            return
+        # Сообщения разных видео отличаются только идентификатором, для ограничения частоты он не важен
+        rate_key = YTDL_MESSAGE_ID.sub(r'\1 *:', msg)
+        self._log.log(level, '%s', msg, extra={'rate_key': rate_key})
+
+    def debug(self, msg):
+        # Через debug yt-dlp передает и обычный вывод, отладочные сообщения начинаются с "[debug] "
+        if msg.startswith('[debug] '):
+            self._write(logging.DEBUG, msg[len('[debug] '):])
+        else:
+            self._write(logging.INFO, msg)
+
+    def info(self, msg):
+        self._write(logging.INFO, msg)
+
+    def warning(self, msg):
+        self._write(logging.WARNING, msg)
+
+    def error(self, msg):
+        self._write(logging.ERROR, msg)
+
+
+def setup_logging():
+    """Настраивает корневой журнал: очередь, поток вывода, уровни модулей (повторный вызов ничего не делает)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if LOG_FILE:
+        # Файл открывается на дозапись, поэтому в него могут писать и процессы launcher.py
+        handlers.append(logging.FileHandler(LOG_FILE, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # Фильтр стоит до очереди, чтобы подавленные сообщения не форматировались и не занимали память
+    queue_handler.addFilter(RateLimitFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+    for name, level in LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
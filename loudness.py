@@ -0,0 +1,160 @@
+"""
+Модуль нормализации громкости треков.
+Интегральная громкость (EBU R128) трека один раз измеряется фоновым процессом FFmpeg
+по файлу аудиокэша (без повторной загрузки из сети) и сохраняется в SQLite. При следующих
+воспроизведениях громкость трека выравнивается заранее рассчитанным множителем.
+"""
+
+import asyncio
+import logging
+import re
+import sqlite3
+import subprocess
+import threading
+import time
+from config import (
+    CACHE_DB_PATH, LOUDNESS_ENABLED, LOUDNESS_TARGET,
+    LOUDNESS_MAX_BOOST, LOUDNESS_WORKERS
+)
+from metadata_cache import normalize_query
+from audio_cache import audio_cache
+from ffmpeg_supervisor import ffmpeg_supervisor, FFmpegBusyError, KIND_ANALYSIS
+
+log = logging.getLogger(__name__)
+
+# Итоговая сводка фильтра ebur128 начинается строкой "[Parsed_ebur128_0 @ ...] Summary:"
+SUMMARY_START = b'Summary:'
+# Интегральная громкость в сводке: "Integrated loudness:\n    I: -14.2 LUFS"
+INTEGRATED_LOUDNESS = re.compile(r'Integrated loudness:\s*I:\s*(-?\d+(?:\.\d+)?) LUFS')
+
+
+def parse_integrated_loudness(summary):
+    """Возвращает интегральную громкость (LUFS) из итоговой сводки фильтра ebur128 или None."""
+    match = INTEGRATED_LOUDNESS.search(summary)
+    return float(match.group(1)) if match else None
+
+
+class LoudnessCache:
+    """Измеренная громкость треков в SQLite и расчет множителя для выравнивания."""
+
+    def __init__(self, db_path=CACHE_DB_PATH, *, enabled=LOUDNESS_ENABLED, target=LOUDNESS_TARGET,
+                 max_boost=LOUDNESS_MAX_BOOST):
+        self._enabled = enabled
+        self._target = target
+        self._max_boost = max_boost
+        self._semaphore = None  # Создается в цикле событий при первом измерении
+        self._pending = set()  # Ключи треков, которые сейчас измеряются
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS track_loudness (
+                track_key TEXT PRIMARY KEY,
+                lufs REAL,
+                measured_at REAL
+            )
+        """)
+        self._db.commit()
+
+        # Трек измеряется сразу после сохранения в аудиокэш
+        audio_cache.add_listener(self._on_cached)
+
+    @property
+    def pending_jobs(self):
+        """Количество треков, которые сейчас измеряются."""
+        return len(self._pending)
+
+    def _lookup(self, key):
+        """Возвращает (измерен ли трек, громкость в LUFS или None, если ее не удалось определить)."""
+        with self._lock:
+            row = self._db.execute("SELECT lufs FROM track_loudness WHERE track_key = ?", (key,)).fetchone()
+        return (False, None) if row is None else (True, row[0])
+
+    def gain(self, track):
+        """Множитель громкости, приводящий трек к целевой громкости (1.0, если трек еще не измерен)."""
+        if not self._enabled:
+            return 1.0
+
+        _, lufs = self._lookup(normalize_query(track.url))
+        if lufs is None:
+            return 1.0
+
+        # Тихие треки усиливаются не больше чем на max_boost дБ, чтобы не усиливать шум и не перегружать звук
+        gain_db = min(self._target - lufs, self._max_boost)
+        return 10 ** (gain_db / 20)
+
+    def ensure(self, track, *, ffmpeg_path="ffmpeg"):
+        """Запускает фоновое измерение громкости трека, если она еще не известна и трек есть в аудиокэше."""
+        if not self._enabled:
+            return
+
+        # Поток из сети ради измерения повторно не загружаем: треки без файла
+        # измеряются, когда аудиокэш их сохранит
+        path = audio_cache.lookup(track)
+        if path is not None:
+            self._schedule(normalize_query(track.url), path, ffmpeg_path)
+
+    def _on_cached(self, key, path, ffmpeg_path):
+        if self._enabled:
+            self._schedule(key, path, ffmpeg_path)
+
+    def _schedule(self, key, path, ffmpeg_path):
+        if key in self._pending or self._lookup(key)[0]:
+            return
+
+        self._pending.add(key)
+        asyncio.get_running_loop().create_task(self._measure(key, path, ffmpeg_path))
+
+    async def _measure(self, key, path, ffmpeg_path):
+        """Измеряет интегральную громкость файла трека фильтром ebur128 и сохраняет результат."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(LOUDNESS_WORKERS)
+
+        try:
+            async with self._semaphore:
+                args = [
+                    ffmpeg_path, '-nostdin', '-hide_banner', '-nostats', '-loglevel', 'info',
+                    '-i', path,
+                    # Значения по кадрам выводятся на уровне verbose и при -loglevel info не печатаются
+                    '-vn', '-af', 'ebur128=framelog=verbose',
+                    '-f', 'null', '-',
+                ]
+                # Измерение не ждет места под процесс: трек будет измерен при следующем воспроизведении
+                async with ffmpeg_supervisor.spawn(timeout=0):
+                    process = ffmpeg_supervisor.adopt(
+                        await asyncio.create_subprocess_exec(
+                            *args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+                        ),
+                        kind=KIND_ANALYSIS
+                    )
+                # Весь вывод не накапливаем: нужна только итоговая сводка в конце
+                summary = []
+                async for line in process.stderr:
+                    if summary or SUMMARY_START in line:
+                        summary.append(line)
+                await process.wait()
+                if process.returncode != 0:
+                    log.warning("Не удалось измерить громкость трека: FFmpeg завершился с кодом %s", process.returncode)
+                    return
+
+            lufs = parse_integrated_loudness(b''.join(summary).decode('utf-8', 'replace'))
+            with self._lock:
+                # Громкость тишины не определена: сохраняем NULL, чтобы не измерять трек снова
+                self._db.execute(
+                    "INSERT OR REPLACE INTO track_loudness VALUES (?, ?, ?)", (key, lufs, time.time())
+                )
+                self._db.commit()
+            log.info("Громкость трека %s: %s LUFS", key, lufs)
+
+        except FFmpegBusyError:
+            log.debug("Измерение громкости отложено: достигнут лимит процессов FFmpeg")
+
+        except Exception:
+            log.exception("Ошибка при измерении громкости трека")
+
+        finally:
+            self._pending.discard(key)
+
+
+# Общий кэш громкости для всего бота
+loudness_cache = LoudnessCache()
@@ -4,6 +4,7 @@
 """
 
 import os
+import logging
 import discord
 from discord.ext import commands
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
@@ -11,49 +12,76 @@ import requests
 from dotenv import load_dotenv
 
 # Импортируем модули проекта
-from config import COMMAND_PREFIX, BOT_DESCRIPTION, configure_ssl
+from config import (
+    COMMAND_PREFIX, BOT_DESCRIPTION,
+    METRICS_ENABLED, METRICS_HOST, METRICS_PORT
+)
 from music_commands import Music
+from shard_stats import publish_loop
+from metrics import start_metrics_server
+from logging_setup import setup_logging
+
+# Журнал настраивается до остальной инициализации, чтобы не потерять ее сообщения
+setup_logging()
+log = logging.getLogger(__name__)
 
 # Отключаем предупреждения SSL для requests
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
 
-# Настраиваем SSL для безопасных соединений
-ssl_context = configure_ssl()
-
 # Настройка и создание бота
-def create_bot():
-    """Создает и настраивает экземпляр бота Discord."""
+def create_bot(shard_ids=None, shard_count=None):
+    """Создает и настраивает экземпляр бота Discord.
+    
+    Если указано shard_count, создается AutoShardedBot, обслуживающий шарды shard_ids
+    (используется рабочими процессами launcher.py).
+    """
     
     # Настройка привилегий бота
     intents = discord.Intents.default()
     intents.message_content = True
     
     # Создание экземпляра бота с нужными настройками
-    bot = commands.Bot(
-        command_prefix=COMMAND_PREFIX, 
-        description=BOT_DESCRIPTION,
-        intents=intents
-    )
+    if shard_count:
+        bot = commands.AutoShardedBot(
+            command_prefix=COMMAND_PREFIX,
+            description=BOT_DESCRIPTION,
+            intents=intents,
+            shard_ids=shard_ids,
+            shard_count=shard_count
+        )
+    else:
+        bot = commands.Bot(
+            command_prefix=COMMAND_PREFIX, 
+            description=BOT_DESCRIPTION,
+            intents=intents
+        )
     
     # Добавляем обработчик события готовности
     @bot.event
     async def on_ready():
         """Вызывается, когда бот полностью готов к работе."""
-        print("="*50)
-        print(f"✅ Бот {bot.user.name} успешно запущен!")
-        print(f"ID: {bot.user.id}")
-        print(f"Префикс команд: {COMMAND_PREFIX}")
-        print("="*50)
+        log.info("Бот %s (ID: %s) успешно запущен, префикс команд: %s",
+                 bot.user.name, bot.user.id, COMMAND_PREFIX)
+        if bot.shard_count:
+            log.info("Шарды: %s из %s", list(bot.shards), bot.shard_count)
     
     # Возвращаем настроенный экземпляр бота
     return bot
 
 # Настройка и запуск бота
-async def setup_hook(bot):
+async def setup_hook(bot, worker_id=None):
     """Настраивает модули бота."""
     # Добавляем музыкальные команды
     await bot.add_cog(Music(bot))
-    print("✅ Музыкальный модуль успешно загружен")
+    log.info("Музыкальный модуль успешно загружен")
+    
+    # Сервер метрик: у каждого процесса launcher.py свой порт
+    if METRICS_ENABLED:
+        start_metrics_server(METRICS_HOST, METRICS_PORT + (worker_id or 0))
+    
+    # Рабочий процесс launcher.py публикует свою статистику в общее хранилище
+    if worker_id is not None:
+        bot.loop.create_task(publish_loop(bot, worker_id))
 
 # Получение токена из файла .env или запрос у пользователя
 def get_token():
@@ -63,10 +91,10 @@ def get_token():
         load_dotenv()
         token = os.getenv("DISCORD_TOKEN")
         if token:
-            print("✅ Токен успешно загружен из .env файла")
+            log.info("Токен успешно загружен из .env файла")
             return token
     except Exception as e:
-        print(f"⚠️ Ошибка при загрузке .env файла: {e}")
+        log.warning("Ошибка при загрузке .env файла: %s", e)
     
     # Если токен не найден, запрашиваем у пользователя
     print("\n❗ Токен Discord не найден в .env файле")
@@ -97,8 +125,9 @@ def main():
     token = get_token()
     
     # Запускаем бота
-    print("🚀 Запуск бота...")
-    bot.run(token)
+    log.info("Запуск бота...")
+    # Журнал уже настроен, discord.py не должен добавлять свой обработчик
+    bot.run(token, log_handler=None)
 
 # Точка входа в программу
 if __name__ == "__main__":
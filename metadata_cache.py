@@ -0,0 +1,210 @@
+"""
+Модуль постоянного кэша метаданных треков и результатов поиска.
+Хранит название, длительность, ссылку и URL потока в SQLite,
+чтобы повторные запросы не требовали извлечения через yt-dlp.
+"""
+
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse, parse_qs
+from config import (
+    CACHE_DB_PATH, METADATA_CACHE_TTL, METADATA_CACHE_MAX_ENTRIES,
+    PREFETCH_EXPIRY_MARGIN
+)
+from track import stream_expiry
+
+# Сколько обращений к трекам накапливается в памяти, прежде чем их время записывается в базу
+ACCESS_FLUSH_SIZE = 100
+
+# Хосты, для которых из ссылки можно получить ID видео без извлечения
+YOUTUBE_HOSTS = ('youtube.com', 'www.youtube.com', 'm.youtube.com', 'music.youtube.com')
+
+
+def video_id_from_url(url):
+    """Возвращает ID видео YouTube из ссылки или None."""
+    parsed = urlparse(url)
+    host = parsed.netloc.lower()
+
+    if host == 'youtu.be':
+        return parsed.path.strip('/') or None
+
+    if host in YOUTUBE_HOSTS and parsed.path == '/watch':
+        video_id = parse_qs(parsed.query).get('v')
+        return video_id[0] if video_id else None
+
+    return None
+
+
+def normalize_query(query):
+    """Приводит поисковый запрос или ссылку к ключу кэша."""
+    query = query.strip()
+    if query.startswith(('http://', 'https://')):
+        video_id = video_id_from_url(query)
+        return f"id:{video_id}" if video_id else query
+
+    # Поисковые запросы сравниваем без учета регистра и лишних пробелов
+    return "search:" + re.sub(r'\s+', ' ', query.lower())
+
+
+class MetadataCache:
+    """Кэш метаданных треков в SQLite с TTL и вытеснением давно не используемых записей."""
+
+    def __init__(self, path=CACHE_DB_PATH, *, ttl=METADATA_CACHE_TTL, max_entries=METADATA_CACHE_MAX_ENTRIES):
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._touched = {}  # video_id -> время последнего обращения, еще не записанное в базу
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS tracks (
+                video_id TEXT PRIMARY KEY,
+                title TEXT,
+                duration INTEGER,
+                webpage_url TEXT,
+                stream_url TEXT,
+                stream_expires REAL,
+                updated_at REAL,
+                last_access REAL,
+                stream_codec TEXT
+            );
+            CREATE TABLE IF NOT EXISTS queries (
+                query TEXT PRIMARY KEY,
+                video_id TEXT,
+                created_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS tracks_last_access ON tracks (last_access);
+        """)
+        self._migrate()
+        self._db.commit()
+
+    def _migrate(self):
+        """Добавляет столбцы, которых нет в базе, созданной предыдущей версией бота."""
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(tracks)")}
+        if 'stream_codec' not in columns:
+            self._db.execute("ALTER TABLE tracks ADD COLUMN stream_codec TEXT")
+
+    def lookup(self, query):
+        """Ищет трек по запросу или ссылке.
+
+        Возвращает словарь в формате данных yt-dlp (ключ 'url' есть, только если
+        URL потока еще действителен) или None, если записи нет или она устарела.
+        """
+        key = normalize_query(query)
+        now = time.time()
+
+        with self._lock:
+            if key.startswith('id:'):
+                video_id = key[3:]
+            else:
+                row = self._db.execute(
+                    "SELECT video_id FROM queries WHERE query = ? AND created_at > ?",
+                    (key, now - self._ttl)
+                ).fetchone()
+                if row is None:
+                    return None
+                video_id = row[0]
+
+            row = self._db.execute(
+                "SELECT title, duration, webpage_url, stream_url, stream_expires, stream_codec FROM tracks "
+                "WHERE video_id = ? AND updated_at > ?",
+                (video_id, now - self._ttl)
+            ).fetchone()
+            if row is None:
+                return None
+
+            # Время обращения нужно только для вытеснения: записываем его пачками, а не при каждом поиске
+            self._touched[video_id] = now
+            if len(self._touched) >= ACCESS_FLUSH_SIZE:
+                self._flush_access()
+                self._db.commit()
+
+        title, duration, webpage_url, stream_url, stream_expires, stream_codec = row
+        data = {
+            'id': video_id,
+            'title': title,
+            'duration': duration,
+            'webpage_url': webpage_url,
+        }
+        # URL потока живет намного меньше метаданных, отдаем его только пока он действителен
+        if stream_url and stream_expires - PREFETCH_EXPIRY_MARGIN > now:
+            data['url'] = stream_url
+            data['acodec'] = stream_codec
+        return data
+
+    def store(self, query, data):
+        """Сохраняет данные трека, полученные от yt-dlp, и связывает с ними запрос."""
+        video_id = data.get('id')
+        if not video_id:
+            return
+
+        now = time.time()
+        stream_url = data.get('url')
+        stream_expires = stream_expiry(stream_url) if stream_url else 0.0
+
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO tracks "
+                "(video_id, title, duration, webpage_url, stream_url, stream_expires, "
+                "updated_at, last_access, stream_codec) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (video_id, data.get('title'), int(data.get('duration') or 0),
+                 data.get('webpage_url'), stream_url, stream_expires, now, now, data.get('acodec'))
+            )
+
+            key = normalize_query(query)
+            if not key.startswith('id:'):
+                self._db.execute(
+                    "INSERT OR REPLACE INTO queries VALUES (?, ?, ?)",
+                    (key, video_id, now)
+                )
+
+            self._flush_access()
+            self._evict()
+            self._db.commit()
+
+    def invalidate_stream(self, query):
+        """Забывает URL потока трека (сервер перестал его отдавать), метаданные остаются в кэше."""
+        key = normalize_query(query)
+
+        with self._lock:
+            if key.startswith('id:'):
+                video_id = key[3:]
+            else:
+                row = self._db.execute("SELECT video_id FROM queries WHERE query = ?", (key,)).fetchone()
+                if row is None:
+                    return
+                video_id = row[0]
+
+            self._db.execute(
+                "UPDATE tracks SET stream_url = NULL, stream_expires = 0 WHERE video_id = ?", (video_id,)
+            )
+            self._db.commit()
+
+    def _flush_access(self):
+        """Записывает накопленные времена обращений (вызывается под блокировкой, commit - за вызывающим)."""
+        if self._touched:
+            self._db.executemany(
+                "UPDATE tracks SET last_access = ? WHERE video_id = ?",
+                [(accessed, video_id) for video_id, accessed in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def _evict(self):
+        """Удаляет давно не использовавшиеся записи сверх лимита."""
+        count = self._db.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+        excess = count - self._max_entries
+        if excess <= 0:
+            return
+
+        self._db.execute(
+            "DELETE FROM tracks WHERE video_id IN "
+            "(SELECT video_id FROM tracks ORDER BY last_access LIMIT ?)",
+            (excess,)
+        )
+        self._db.execute("DELETE FROM queries WHERE video_id NOT IN (SELECT video_id FROM tracks)")
+
+
+# Общий кэш для всего бота
+metadata_cache = MetadataCache()
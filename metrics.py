@@ -0,0 +1,237 @@
+"""
+Модуль метрик бота.
+Счетчики, гистограммы и показатели с метками, которые отдаются локальным
+HTTP-сервером в текстовом формате Prometheus (адрес /metrics).
+"""
+
+import bisect
+import http.server
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+# Границы корзин гистограмм по умолчанию (секунды)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Metric:
+    """Базовый класс метрики с набором меток."""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # Значения меток -> значение метрики
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        """Возвращает строки метрики в текстовом формате Prometheus."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """Монотонно растущий счетчик."""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Текущее значение, которое может как расти, так и уменьшаться."""
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def replace(self, values):
+        """Заменяет все значения сразу: {значения меток (кортеж): значение}."""
+        with self._lock:
+            self._values = {tuple(str(v) for v in key): value for key, value in values.items()}
+
+
+class Histogram(Metric):
+    """Распределение длительностей по корзинам."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Счетчики корзин (последняя - +Inf), сумма наблюдений
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Замеряет длительность блока with."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = [(key, (list(counts), total)) for key, (counts, total) in self._values.items()]
+
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Набор метрик, отдаваемых HTTP-сервером."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Возвращает все метрики в текстовом формате Prometheus."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return registry.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()):
+    return registry.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# Извлечение yt-dlp
+EXTRACTIONS = counter('bot_extractions_total', 'Задачи извлечения yt-dlp по результату', ('result',))
+EXTRACTION_WAIT = histogram('bot_extraction_wait_seconds', 'Ожидание задачи извлечения в очереди', ('priority',))
+EXTRACTION_RUN = histogram('bot_extraction_run_seconds', 'Время выполнения извлечения yt-dlp', ('priority',))
+EXTRACTION_BACKLOG = gauge('bot_extraction_backlog', 'Задачи извлечения, ожидающие или выполняющиеся')
+
+# Воспроизведение
+FFMPEG_SPAWN = histogram('bot_ffmpeg_spawn_seconds', 'Создание аудио-источника (запуск FFmpeg)', ('mode',))
+FIRST_FRAME = histogram('bot_first_frame_seconds', 'Время от начала воспроизведения до первого аудиокадра')
+TRACK_TRANSITION = histogram(
+    'bot_track_transition_seconds', 'Время от извлечения трека из очереди до начала воспроизведения', ('prefetched',)
+)
+FFMPEG_PROCESSES = gauge('bot_ffmpeg_processes', 'Запущенные процессы FFmpeg по видам', ('kind',))
+FANOUT_STREAMS = gauge('bot_fanout_streams', 'Общие потоки FFmpeg для нескольких гильдий')
+AUDIO_CACHE_JOBS = gauge('bot_audio_cache_jobs', 'Треки, которые сейчас сохраняются в аудиокэш')
+READAHEAD_UNDERRUNS = counter(
+    'bot_readahead_underruns_total', 'Опустошения буфера упреждающего чтения: PCM не был готов к моменту отправки'
+)
+READAHEAD_FULL = gauge(
+    'bot_readahead_full_buffers', 'Заполненные буферы упреждающего чтения, чтение FFmpeg в которых приостановлено'
+)
+
+# Discord API
+DISCORD_MESSAGES = histogram('bot_discord_message_seconds', 'Отправка и изменение сообщений Discord', ('op',))
+
+# Показатели гильдий
+GUILD_QUEUE_LENGTH = gauge('bot_guild_queue_length', 'Треков в очереди гильдии', ('guild',))
+GUILD_FFMPEG = gauge('bot_guild_ffmpeg_processes', 'Собственные процессы FFmpeg гильдии', ('guild',))
+GUILD_EXTRACTIONS = gauge('bot_guild_extractions_pending', 'Задачи извлечения гильдии в очереди', ('guild',))
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """Отдает метрики по адресу /metrics."""
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+
+        body = registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(host, port):
+    """Запускает HTTP-сервер метрик в фоновом потоке и возвращает его (или None при ошибке)."""
+    try:
+        server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        log.error("Не удалось запустить сервер метрик на %s:%s: %s", host, port, e)
+        return None
+
+    threading.Thread(target=server.serve_forever, daemon=True, name='metrics').start()
+    log.info("Метрики доступны по адресу http://%s:%s/metrics", host, port)
+    return server
@@ -3,11 +3,69 @@
 Реализует класс Music для обработки музыкальных команд Discord бота.
 """
 
+import asyncio
+import logging
+import re
+import time
+from contextlib import aclosing
 import discord
 from discord.ext import commands
-from player import MusicPlayer
-from ytdl_source import YTDLSource
-from config import find_ffmpeg
+from player import MusicPlayer, LOOP_OFF, LOOP_TRACK, LOOP_QUEUE, LOOP_MODES
+from resolver import resolve, iter_playlist, PlaylistHandle
+from playlist_feed import PlaylistFeed
+from state_store import state_store
+from shard_stats import shard_stats
+from fanout import fanout_hub
+from audio_cache import audio_cache
+from ffmpeg_supervisor import ffmpeg_supervisor, KIND_STREAM, KIND_FANOUT, KIND_CACHE, KIND_ANALYSIS
+from metrics import (
+    DISCORD_MESSAGES, EXTRACTION_BACKLOG, FANOUT_STREAMS, AUDIO_CACHE_JOBS,
+    GUILD_QUEUE_LENGTH, GUILD_FFMPEG, GUILD_EXTRACTIONS, FFMPEG_PROCESSES
+)
+from ytdl_pool import ytdl_pool
+from extraction import extraction_scheduler, ExtractorBusyError
+from config import (
+    find_ffmpeg, PLAYLIST_PROGRESS_INTERVAL, QUEUE_PAGE_SIZE, STATE_RESTORE_CONCURRENCY,
+    METRICS_ENABLED, METRICS_UPDATE_INTERVAL, FFMPEG_REAP_INTERVAL
+)
+
+log = logging.getLogger(__name__)
+
+# Сообщения о режиме повтора
+LOOP_STATUS = {
+    LOOP_OFF: "Повтор выключен",
+    LOOP_TRACK: "Повтор трека включен",
+    LOOP_QUEUE: "Повтор очереди включен",
+}
+
+# Ответ пользователю, когда очередь гильдии заполнена
+QUEUE_FULL_MESSAGE = '❌ Очередь заполнена (максимум {} треков). Дождитесь воспроизведения текущих треков.'
+
+# Ответ пользователю, когда очередь извлечения переполнена
+BUSY_MESSAGE = '⏳ Бот сейчас обрабатывает слишком много запросов. Попробуйте еще раз через несколько секунд.'
+
+# Позиция для !seek: секунды, М:СС или Ч:ММ:СС (только цифры - float() принял бы nan, inf и 1e9)
+POSITION_FORMAT = re.compile(r'[0-9]{1,6}(?::[0-5]?[0-9]){0,2}')
+
+async def edit_message(message, content):
+    """Изменяет сообщение, замеряя время запроса к Discord."""
+    with DISCORD_MESSAGES.time(op='edit'):
+        await message.edit(content=content)
+
+def parse_position(text):
+    """Разбирает позицию вида 90, 1:30 или 1:02:03 в секунды (ValueError, если формат неверный)."""
+    if not POSITION_FORMAT.fullmatch(text):
+        raise ValueError(text)
+    
+    seconds = 0
+    for part in text.split(':'):
+        seconds = seconds * 60 + int(part)
+    return float(seconds)
+
+def format_position(seconds):
+    """Возвращает позицию в формате M:SS."""
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}:{seconds:02d}"
 
 class Music(commands.Cog):
     """Команды для управления музыкой."""
@@ -17,24 +75,117 @@ class Music(commands.Cog):
         self.players = {}
         self.ffmpeg_path = find_ffmpeg()
     
+    async def cog_load(self):
+        """Прогревает пул yt-dlp и восстанавливает плееры в фоне, не задерживая запуск бота."""
+        self.bot.loop.run_in_executor(None, ytdl_pool.warm_up)
+        self.bot.loop.create_task(self.restore_players())
+        self.bot.loop.create_task(self.reap_ffmpeg())
+        if METRICS_ENABLED:
+            self.bot.loop.create_task(self.update_metrics())
+    
+    async def reap_ffmpeg(self):
+        """Периодически завершает процессы FFmpeg гильдий, плеер которых уже остановлен."""
+        while not self.bot.is_closed():
+            await asyncio.sleep(FFMPEG_REAP_INTERVAL)
+            ffmpeg_supervisor.reap(self.players.keys())
+    
+    async def update_metrics(self):
+        """Периодически обновляет показатели гильдий и очередей для метрик."""
+        while not self.bot.is_closed():
+            queue_length = {}
+            extractions = {}
+            for guild_id, player in self.players.items():
+                key = (guild_id,)
+                queue_length[key] = len(player.queue)
+                extractions[key] = extraction_scheduler.guild_pending(guild_id)
+            
+            GUILD_QUEUE_LENGTH.replace(queue_length)
+            # Процессы общих потоков не принадлежат гильдиям и учитываются только по видам
+            GUILD_FFMPEG.replace({(guild_id,): count for guild_id, count in ffmpeg_supervisor.guild_counts().items()})
+            FFMPEG_PROCESSES.replace({(kind,): count for kind, count in ffmpeg_supervisor.counts().items()})
+            GUILD_EXTRACTIONS.replace(extractions)
+            EXTRACTION_BACKLOG.set(extraction_scheduler.pending)
+            FANOUT_STREAMS.set(fanout_hub.active_streams)
+            AUDIO_CACHE_JOBS.set(audio_cache.pending_jobs)
+            
+            await asyncio.sleep(METRICS_UPDATE_INTERVAL)
+    
+    async def restore_players(self):
+        """Восстанавливает плееры гильдий, которые играли музыку до перезапуска бота."""
+        await self.bot.wait_until_ready()
+        
+        snapshots = state_store.load_all()
+        if not snapshots:
+            return
+        log.info("Восстановление плееров: %d гильдий", len(snapshots))
+        
+        # Гильдии восстанавливаются понемногу, чтобы не переподключаться ко всем каналам сразу
+        semaphore = asyncio.Semaphore(STATE_RESTORE_CONCURRENCY)
+        
+        async def restore(snapshot):
+            async with semaphore:
+                try:
+                    await self.restore_player(snapshot)
+                except Exception as e:
+                    log.warning("Не удалось восстановить плеер гильдии %s: %s", snapshot.guild_id, e)
+        
+        await asyncio.gather(*(restore(snapshot) for snapshot in snapshots))
+    
+    async def restore_player(self, snapshot):
+        """Переподключается к голосовому каналу и восстанавливает очередь гильдии из снимка."""
+        guild = self.bot.get_guild(snapshot.guild_id)
+        if guild is None or guild.id in self.players:
+            return
+        
+        voice_channel = guild.get_channel(snapshot.voice_channel_id) if snapshot.voice_channel_id else None
+        text_channel = guild.get_channel(snapshot.text_channel_id)
+        
+        # В пустой или удаленный канал не возвращаемся
+        if voice_channel is None or text_channel is None or not any(not m.bot for m in voice_channel.members):
+            state_store.delete_later(guild.id)
+            return
+        
+        if guild.voice_client is None:
+            await voice_channel.connect()
+        
+        player = MusicPlayer(self.bot, guild, text_channel, self)
+        self.players[guild.id] = player
+        player.restore(snapshot)
+        
+        await text_channel.send(f"🔄 Бот перезапущен, воспроизведение продолжается (треков в очереди: {len(player.queue)})")
+    
     async def cleanup(self, guild):
         """Очищает ресурсы и отключается от голосового канала."""
+        player = self.players.pop(guild.id, None)
+        if player is not None:
+            # Цикл останавливается до отключения: иначе завершение текущего трека запустит следующий из очереди
+            await player.stop()
+        
         try:
             await guild.voice_client.disconnect()
         except AttributeError:
             pass
         
-        try:
-            del self.players[guild.id]
-        except KeyError:
-            pass
+        if player is not None:
+            # Очищаем очередь, останавливаем фоновую предзагрузку треков и загрузку плейлистов этой гильдии
+            player.queue.clear()
+            player.prefetcher.cancel_all()
+            player.close_feeds()
+            player.drop_crossfade()
+            
+            # Плеер остановлен намеренно - после перезапуска его восстанавливать не нужно
+            player.cancel_save()
+            state_store.delete_later(guild.id)
+        
+        # Процессы FFmpeg гильдии, которые не закрылись вместе с источником, больше никому не нужны
+        ffmpeg_supervisor.kill_guild(guild.id)
     
     def get_player(self, ctx):
         """Получает или создает плеер для гильдии."""
         try:
             player = self.players[ctx.guild.id]
         except KeyError:
-            player = MusicPlayer(ctx)
+            player = MusicPlayer(ctx.bot, ctx.guild, ctx.channel, self)
             self.players[ctx.guild.id] = player
         
         return player
@@ -63,6 +214,8 @@ class Music(commands.Cog):
         
         # Получаем плеер для этой гильдии
         player = self.get_player(ctx)
+        if player.queue_full:
+            return await ctx.send(QUEUE_FULL_MESSAGE.format(player.max_queue))
         
         # Отправляем промежуточное сообщение
         searching_message = await ctx.send("🔄 Обрабатываю запрос...")
@@ -70,45 +223,48 @@ class Music(commands.Cog):
         # Обрабатываем поисковый запрос или URL
         async with ctx.typing():
             try:
-                # Проверяем, является ли URL плейлистом
-                is_playlist = False
-                if url.startswith(('http://', 'https://')):
-                    is_playlist = await YTDLSource.is_playlist(url, loop=self.bot.loop)
+                # Разбираем запрос за одно извлечение
+                result = await resolve(url, guild_id=ctx.guild.id)
                 
-                if is_playlist:
-                    await searching_message.edit(
-                        content=f'ℹ️ Обнаружен плейлист YouTube. Добавляю только первый трек. Используйте `!playlist {url}` для добавления всего плейлиста.'
-                    )
-                
-                # Получаем аудио-источник
-                source = await YTDLSource.from_url(
-                    url, 
-                    loop=self.bot.loop, 
-                    stream=True,
-                    ffmpeg_path=self.ffmpeg_path,
-                    process_playlist=False  # Не обрабатываем плейлист полностью
-                )
+                if isinstance(result, PlaylistHandle):
+                    # Из плейлиста берем только первый трек
+                    async with aclosing(iter_playlist(result, guild_id=ctx.guild.id)) as tracks:
+                        track = await anext(tracks, None)
+                    if track is None:
+                        raise ValueError("Плейлист не содержит треков")
+                    
+                    note = f'\nℹ️ Обнаружен плейлист YouTube, добавлен только первый трек. Используйте `!playlist {url}` для добавления всего плейлиста.'
+                else:
+                    track = result.track
+                    note = ''
+                track.requester = ctx.author.display_name
                 
                 # Обновляем сообщение с результатом поиска
-                await searching_message.edit(
-                    content=f'✅ Добавлено в очередь: **{source.title}**{source.duration_string}'
+                await edit_message(
+                    searching_message,
+                    f'✅ Добавлено в очередь: **{track.title}**{track.duration_string}{note}'
                 )
                 
                 # Добавляем в очередь
-                await player.queue.put(source)
+                await player.enqueue(track)
+            
+            except ExtractorBusyError:
+                await edit_message(searching_message, BUSY_MESSAGE)
             
             except ValueError as e:
-                await searching_message.edit(
-                    content=f'❌ Ошибка: {str(e)}\n💡 Попробуйте другой трек или прямую ссылку на YouTube'
+                await edit_message(
+                    searching_message,
+                    f'❌ Ошибка: {str(e)}\n💡 Попробуйте другой трек или прямую ссылку на YouTube'
                 )
-                print(f"Ошибка при воспроизведении: {e}")
+                log.warning("Ошибка при воспроизведении: %s", e)
             
             except Exception as e:
-                await searching_message.edit(
-                    content=f'❌ Неожиданная ошибка: {str(e)[:100]}...\n'
+                await edit_message(
+                    searching_message,
+                    f'❌ Неожиданная ошибка: {str(e)[:100]}...\n'
                     f'💡 Попробуйте другой трек или перезапустите бота'
                 )
-                print(f"Подробная ошибка: {e}")
+                log.exception("Неожиданная ошибка при воспроизведении")
     
     @commands.command(name='playlist', help='Воспроизводит весь плейлист YouTube')
     async def playall(self, ctx, *, url):
@@ -119,6 +275,8 @@ class Music(commands.Cog):
         
         # Получаем плеер для этой гильдии
         player = self.get_player(ctx)
+        if player.queue_full:
+            return await ctx.send(QUEUE_FULL_MESSAGE.format(player.max_queue))
         
         # Отправляем промежуточное сообщение
         searching_message = await ctx.send("🔄 Обрабатываю плейлист...")
@@ -126,61 +284,74 @@ class Music(commands.Cog):
         # Обрабатываем URL плейлиста
         async with ctx.typing():
             try:
-                # Проверяем, является ли это плейлистом
-                is_playlist = False
-                if url.startswith(('http://', 'https://')):
-                    is_playlist = await YTDLSource.is_playlist(url, loop=self.bot.loop)
+                # Разбираем запрос за одно извлечение
+                result = await resolve(url, guild_id=ctx.guild.id)
                 
-                if not is_playlist:
-                    # Если это не плейлист, обрабатываем как обычный трек
-                    source = await YTDLSource.from_url(
-                        url, 
-                        loop=self.bot.loop, 
-                        stream=True,
-                        ffmpeg_path=self.ffmpeg_path
+                if not isinstance(result, PlaylistHandle):
+                    # Если это не плейлист, добавляем как обычный трек
+                    track = result.track
+                    track.requester = ctx.author.display_name
+                    await edit_message(
+                        searching_message,
+                        f'ℹ️ Это не плейлист. Добавлен трек: **{track.title}**{track.duration_string}'
                     )
                     
-                    await searching_message.edit(
-                        content=f'ℹ️ Это не плейлист. Добавлен трек: **{source.title}**{source.duration_string}'
-                    )
-                    
-                    await player.queue.put(source)
+                    await player.enqueue(track)
                     return
                 
-                # Получаем все треки из плейлиста
-                playlist_title, tracks = await YTDLSource.get_playlist_items(
-                    url,
-                    loop=self.bot.loop,
-                    ffmpeg_path=self.ffmpeg_path
-                )
+                # Треки добавляются в очередь по порядку, по мере их получения и до лимита очереди,
+                # остальные - по мере воспроизведения
+                feed = PlaylistFeed(result, guild_id=ctx.guild.id, requester=ctx.author.display_name)
+                total = f"/{feed.total}" if feed.total else ""
+                last_update = time.monotonic()
+                
+                async def report_progress(feed):
+                    # Сообщение о прогрессе обновляем не чаще заданного интервала
+                    nonlocal last_update
+                    now = time.monotonic()
+                    if now - last_update >= PLAYLIST_PROGRESS_INTERVAL:
+                        last_update = now
+                        await edit_message(
+                            searching_message,
+                            f'🔄 Обрабатываю плейлист **{feed.title}**... ({feed.added}{total})'
+                        )
+                
+                await player.add_feed(feed, on_progress=report_progress)
                 
-                if not tracks:
-                    await searching_message.edit(
-                        content=f'❌ Плейлист не содержит треков или не удалось их извлечь.'
+                if feed.exhausted and not feed.added:
+                    await edit_message(
+                        searching_message,
+                        f'❌ Плейлист не содержит треков или не удалось их извлечь.'
                     )
                     return
                 
-                # Добавляем все треки в очередь
-                for track in tracks:
-                    await player.queue.put(track)
-                
                 # Обновляем сообщение с результатом
-                await searching_message.edit(
-                    content=f'✅ Добавлен плейлист: **{playlist_title}** ({len(tracks)} треков)'
-                )
+                if feed.exhausted:
+                    content = f'✅ Добавлен плейлист: **{feed.title}** ({feed.added} треков)'
+                else:
+                    content = (
+                        f'✅ Добавлен плейлист: **{feed.title}** (в очереди {feed.added}{total} треков, '
+                        f'остальные будут добавляться по мере воспроизведения)'
+                    )
+                await edit_message(searching_message, content)
+            
+            except ExtractorBusyError:
+                await edit_message(searching_message, BUSY_MESSAGE)
             
             except ValueError as e:
-                await searching_message.edit(
-                    content=f'❌ Ошибка при обработке плейлиста: {str(e)}\n💡 Проверьте ссылку на плейлист.'
+                await edit_message(
+                    searching_message,
+                    f'❌ Ошибка при обработке плейлиста: {str(e)}\n💡 Проверьте ссылку на плейлист.'
                 )
-                print(f"Ошибка при воспроизведении плейлиста: {e}")
+                log.warning("Ошибка при воспроизведении плейлиста: %s", e)
             
             except Exception as e:
-                await searching_message.edit(
-                    content=f'❌ Неожиданная ошибка: {str(e)[:100]}...\n'
+                await edit_message(
+                    searching_message,
+                    f'❌ Неожиданная ошибка: {str(e)[:100]}...\n'
                     f'💡 Возможно, плейлист слишком большой или недоступен.'
                 )
-                print(f"Подробная ошибка плейлиста: {e}")
+                log.exception("Неожиданная ошибка при воспроизведении плейлиста")
     
     @commands.command(name='pause', help='Приостанавливает текущий трек')
     async def pause(self, ctx):
@@ -222,39 +393,113 @@ class Music(commands.Cog):
             return await ctx.send("В данный момент ничего не воспроизводится.")
         
         # Пропускаем текущий трек
-        voice_client.stop()
+        self.get_player(ctx).skip()
         await ctx.send("⏭️ Трек пропущен")
     
-    @commands.command(name='loop', help='Включает/выключает повтор текущего трека')
-    async def toggle_loop(self, ctx):
-        """Включает или выключает повтор текущего трека."""
+    @commands.command(name='seek', help='Перематывает текущий трек: !seek 1:30 или !seek 90')
+    async def seek(self, ctx, position):
+        """Перематывает текущий трек на указанную позицию."""
+        voice_client = ctx.voice_client
+        
+        if not voice_client or not voice_client.is_connected():
+            return await ctx.send("Я не подключен к голосовому каналу.")
+        
         player = self.get_player(ctx)
-        player.loop = not player.loop
+        track = player.current_track
+        if player.current is None or track is None:
+            return await ctx.send("В данный момент ничего не воспроизводится.")
         
-        status = "включен" if player.loop else "выключен"
-        await ctx.send(f"🔄 Повтор трека {status}")
+        try:
+            seconds = parse_position(position)
+        except ValueError:
+            return await ctx.send("❌ Укажите позицию в формате `1:30` или в секундах: `90`")
+        
+        if track.duration and seconds >= track.duration:
+            return await ctx.send(f"❌ Трек длится {format_position(track.duration)}")
+        
+        player.seek(seconds)
+        await ctx.send(f"⏩ Перемотка на {format_position(seconds)}")
+    
+    @commands.command(name='loop', help='Повтор: !loop [track|queue|off], без параметра включает/выключает повтор трека')
+    async def toggle_loop(self, ctx, mode=None):
+        """Переключает режим повтора трека или очереди."""
+        player = self.get_player(ctx)
+        
+        if mode is None:
+            mode = LOOP_OFF if player.loop == LOOP_TRACK else LOOP_TRACK
+        mode = mode.lower()
+        
+        if mode not in LOOP_MODES:
+            return await ctx.send("❌ Неизвестный режим повтора. Используйте: `track`, `queue` или `off`")
+        
+        player.set_loop(mode)
+        await ctx.send(f"🔄 {LOOP_STATUS[mode]}")
     
-    @commands.command(name='queue', help='Показывает очередь треков')
-    async def queue_info(self, ctx):
-        """Отображает текущую очередь треков."""
+    @commands.command(name='queue', help='Показывает очередь треков: !queue [страница]')
+    async def queue_info(self, ctx, page: int = 1):
+        """Отображает страницу текущей очереди треков."""
         player = self.get_player(ctx)
         
         if player.queue.empty():
             return await ctx.send("📋 Очередь пуста.")
         
-        # Получаем треки из очереди без их извлечения
-        queue_list = list(player.queue._queue)
+        total = len(player.queue)
+        pages = (total + QUEUE_PAGE_SIZE - 1) // QUEUE_PAGE_SIZE
+        page = min(max(page, 1), pages)
+        
+        # Создаем строку с информацией о треках страницы
+        queue_message = f"**📋 Очередь треков** (страница {page}/{pages}, всего {total}):\n"
+        first = (page - 1) * QUEUE_PAGE_SIZE + 1
+        for i, track in enumerate(player.queue.page(page, QUEUE_PAGE_SIZE), first):
+            requester = f" - {track.requester}" if track.requester else ""
+            queue_message += f"{i}. {track.title}{track.duration_string}{requester}\n"
         
-        # Создаем строку с информацией о треках (до 10 треков)
-        queue_message = "**📋 Очередь треков:**\n"
-        for i, track in enumerate(queue_list[:10], 1):
-            queue_message += f"{i}. {track.title}{track.duration_string}\n"
+        if page < pages:
+            queue_message += f"Следующая страница: `!queue {page + 1}`\n"
         
-        if len(queue_list) > 10:
-            queue_message += f"... и еще {len(queue_list) - 10} треков"
+        # Плейлисты, которые еще загружаются
+        for feed in player.feeds:
+            queue_message += f"➕ Плейлист **{feed.title}** дополнит очередь по мере воспроизведения\n"
         
         await ctx.send(queue_message)
     
+    @commands.command(name='remove', help='Удаляет трек из очереди: !remove <номер>')
+    async def remove(self, ctx, position: int):
+        """Удаляет трек из очереди по его номеру."""
+        player = self.get_player(ctx)
+        
+        if not 1 <= position <= len(player.queue):
+            return await ctx.send(f"❌ В очереди нет трека с номером {position}.")
+        
+        track = player.queue.remove(position - 1)
+        player.queue_changed()
+        await ctx.send(f"🗑️ Удален из очереди: **{track.title}**")
+    
+    @commands.command(name='move', help='Перемещает трек в очереди: !move <откуда> <куда>')
+    async def move(self, ctx, source: int, destination: int):
+        """Перемещает трек на другую позицию в очереди."""
+        player = self.get_player(ctx)
+        size = len(player.queue)
+        
+        if not (1 <= source <= size and 1 <= destination <= size):
+            return await ctx.send(f"❌ Номера треков должны быть от 1 до {size}.")
+        
+        track = player.queue.move(source - 1, destination - 1)
+        player.queue_changed()
+        await ctx.send(f"↕️ **{track.title}** перемещен на позицию {destination}")
+    
+    @commands.command(name='shuffle', help='Перемешивает очередь треков')
+    async def shuffle(self, ctx):
+        """Перемешивает треки в очереди."""
+        player = self.get_player(ctx)
+        
+        if player.queue.empty():
+            return await ctx.send("📋 Очередь пуста.")
+        
+        player.queue.shuffle()
+        player.queue_changed()
+        await ctx.send("🔀 Очередь перемешана")
+    
     @commands.command(name='now', help='Показывает текущий трек')
     async def now_playing(self, ctx):
         """Отображает информацию о текущем треке."""
@@ -271,6 +516,60 @@ class Music(commands.Cog):
         source = voice_client.source
         await ctx.send(f"🎵 Сейчас играет: **{source.title}**{source.duration_string}")
     
+    @commands.command(name='stats', help='Показывает статистику извлечения треков')
+    async def extraction_stats(self, ctx):
+        """Отображает время ожидания и выполнения задач извлечения."""
+        stats = extraction_scheduler.stats
+        avg_wait, avg_run = stats.averages()
+        
+        await ctx.send(
+            "**📊 Статистика извлечения:**\n"
+            f"В очереди: {extraction_scheduler.pending}\n"
+            f"Выполнено: {stats.completed}, с ошибкой: {stats.failed}, отклонено: {stats.rejected}\n"
+            f"Среднее ожидание: {avg_wait:.2f} с (макс. {stats.max_wait:.2f} с)\n"
+            f"Среднее выполнение: {avg_run:.2f} с\n"
+            f"{self._ffmpeg_stats()}"
+            f"{self._cluster_stats()}"
+        )
+    
+    @staticmethod
+    def _ffmpeg_stats():
+        """Строка о запущенных процессах FFmpeg."""
+        counts = ffmpeg_supervisor.counts()
+        return (
+            f"Процессы FFmpeg: {sum(counts.values())}/{ffmpeg_supervisor.limit} "
+            f"(воспроизведение {counts[KIND_STREAM]}, общие потоки {counts[KIND_FANOUT]}, кэш {counts[KIND_CACHE]}, "
+            f"измерение громкости {counts[KIND_ANALYSIS]})"
+        )
+    
+    @staticmethod
+    def _cluster_stats():
+        """Сводка по всем процессам, если бот запущен через launcher.py."""
+        rows = shard_stats.workers()
+        if len(rows) < 2:
+            return ""
+        return (
+            f"\nВсе процессы ({len(rows)}): гильдий {sum(row['guilds'] for row in rows)}, "
+            f"плееров {sum(row['players'] for row in rows)}, "
+            f"извлечений {sum(row['extractions'] for row in rows)}"
+        )
+    
+    @commands.command(name='memory', help='Показывает память, занятую очередями треков')
+    async def memory_stats(self, ctx):
+        """Отображает оценку памяти очереди этой гильдии и всех гильдий."""
+        player = self.get_player(ctx)
+        guild_tracks = len(player.queue)
+        guild_bytes = player.queue.memory_size()
+        
+        total_tracks = sum(len(p.queue) for p in self.players.values())
+        total_bytes = sum(p.queue.memory_size() for p in self.players.values())
+        
+        await ctx.send(
+            "**🧠 Память очередей:**\n"
+            f"Эта гильдия: {guild_tracks} треков, {guild_bytes / 1024:.1f} КиБ\n"
+            f"Все гильдии ({len(self.players)}): {total_tracks} треков, {total_bytes / 1024:.1f} КиБ"
+        )
+    
     @commands.command(name='stop', help='Останавливает плеер и очищает очередь')
     async def stop(self, ctx):
         """Останавливает воспроизведение и очищает очередь."""
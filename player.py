@@ -4,30 +4,73 @@
 """
 
 import asyncio
+import logging
+import time
+from collections import deque
 from async_timeout import timeout
-from config import PLAYER_TIMEOUT, DEFAULT_VOLUME
+from config import (
+    PLAYER_TIMEOUT, DEFAULT_VOLUME, MAX_QUEUE_LENGTH, GUILD_MAX_QUEUE_LENGTH,
+    STATE_SAVE_DELAY, STATE_SAVE_INTERVAL, PREFETCH_EXPIRY_MARGIN,
+    STREAM_RECOVERY_ATTEMPTS, STREAM_RECOVERY_MARGIN, DSP_CROSSFADE, DSP_CROSSFADE_PREPARE
+)
+from ytdl_source import YTDLSource
+from dsp import DSPSource, SAMPLES_PER_FRAME
+from prefetch import Prefetcher
+from audio_cache import audio_cache
+from loudness import loudness_cache
+from metadata_cache import metadata_cache
+from track_queue import TrackQueue
+from track import Track
+from state_store import state_store, PlayerSnapshot
+from metrics import TRACK_TRANSITION, DISCORD_MESSAGES
+from extraction import ExtractorBusyError
+
+log = logging.getLogger(__name__)
+
+# Пауза перед повторной попыткой, если планировщик извлечения или лимит процессов FFmpeg перегружены
+BUSY_RETRY_DELAY = 5
+
+# Режимы повтора
+LOOP_OFF = 'off'  # Без повтора
+LOOP_TRACK = 'track'  # Повтор текущего трека
+LOOP_QUEUE = 'queue'  # Повтор всей очереди: сыгранный трек уходит в конец
+LOOP_MODES = (LOOP_OFF, LOOP_TRACK, LOOP_QUEUE)
 
 class MusicPlayer:
     """Класс для управления музыкой и очередью треков."""
     
     __slots__ = ('bot', '_guild', '_channel', '_cog', 'queue', 'next', 
-                 'current', 'np', 'volume', 'loop')
+                 'current', 'current_track', 'np', 'volume', 'loop', 'skipped', 'prefetcher',
+                 'feeds', 'max_queue', 'seek_to', '_filling', '_save_handle', '_resume', '_recoveries',
+                 '_crossfade', '_crossfade_checked', '_loop_task')
     
-    def __init__(self, ctx):
-        self.bot = ctx.bot
-        self._guild = ctx.guild
-        self._channel = ctx.channel
-        self._cog = ctx.cog
+    def __init__(self, bot, guild, channel, cog):
+        self.bot = bot
+        self._guild = guild
+        self._channel = channel
+        self._cog = cog
         
-        self.queue = asyncio.Queue()
+        self.queue = TrackQueue()
         self.next = asyncio.Event()
         
         self.np = None  # Текущий трек (сообщение)
         self.volume = DEFAULT_VOLUME
         self.current = None  # Текущий трек (источник)
-        self.loop = False  # Флаг повтора трека
+        self.current_track = None  # Текущий трек (описание, по которому его можно воспроизвести снова)
+        self.loop = LOOP_OFF  # Режим повтора
+        self.skipped = False  # Текущий трек пропущен командой !skip
+        self.prefetcher = Prefetcher(self)  # Предзагрузка потоков следующих треков
+        self.feeds = deque()  # Плейлисты, треки которых добавляются в очередь по мере воспроизведения
+        self.max_queue = GUILD_MAX_QUEUE_LENGTH.get(guild.id, MAX_QUEUE_LENGTH)
+        self.seek_to = None  # Позиция (секунды), на которую !seek перематывает текущий трек
+        self._filling = None  # Задача дополнения очереди из плейлистов
+        self._save_handle = None  # Запланированное сохранение состояния
+        self._resume = False  # Первый трек очереди - продолжение текущего (перемотка или восстановление потока)
+        self._recoveries = 0  # Попытки восстановить оборвавшийся поток текущего трека
+        self._crossfade = None  # (трек, источник) следующего трека, уже наложенного на конец текущего
+        self._crossfade_checked = None  # Источник, для которого наложение уже подготавливалось
         
-        ctx.bot.loop.create_task(self.player_loop())
+        self._loop_task = bot.loop.create_task(self.player_loop())
     
     async def player_loop(self):
         """Главный цикл проигрывателя."""
@@ -35,20 +78,88 @@ class MusicPlayer:
         
         while not self.bot.is_closed():
             self.next.clear()
+            self.skipped = False
             
             try:
                 # Ждем следующий трек с таймаутом
                 async with timeout(PLAYER_TIMEOUT):
-                    source = await self.queue.get()
+                    track = await self.queue.get()
             except asyncio.TimeoutError:
                 # Выходим из голосового канала после таймаута
                 return self.destroy(self._guild)
             
+            # Продолжение того же трека не считается новым воспроизведением
+            resuming = self._resume
+            self._resume = False
+            if not resuming:
+                self._recoveries = 0
+            
+            # До начала воспроизведения трек сохраняется в состоянии как текущий
+            self.current_track = track
+            taken_at = time.perf_counter()
+            prefetched = 'yes' if track.has_fresh_stream(PREFETCH_EXPIRY_MARGIN) else 'no'
+            
+            # Забираем трек из окна предзагрузки и сдвигаем окно на следующие треки
+            await self.prefetcher.take(track)
+            self.prefetcher.schedule()
+            
+            # В очереди освободилось место - дополняем ее из загружаемых плейлистов
+            if self.feeds:
+                self.refill()
+            
+            # Треки хранятся в очереди без аудио-источника, создаем его перед воспроизведением
+            # (если источник не был запущен заранее для наложения на предыдущий трек)
+            source = self._take_crossfade(track)
+            try:
+                if source is None:
+                    source = await YTDLSource.from_track(
+                        track,
+                        ffmpeg_path=self._cog.ffmpeg_path,
+                        guild_id=self.guild_id,
+                        volume=self.volume
+                    )
+            except ExtractorBusyError:
+                # Трек не потерян: возвращаем его в начало очереди и ждем разгрузки
+                self.current_track = None
+                self.queue.appendleft(track)
+                await asyncio.sleep(BUSY_RETRY_DELAY)
+                continue
+            except ValueError as e:
+                self.current_track = None
+                self.save_state()
+                await self._channel.send(f"❌ Не удалось загрузить трек **{track.title}**: {str(e)}")
+                continue
+            except Exception as e:
+                # Любая другая ошибка (нет FFmpeg, ошибка базы кэша) не должна останавливать цикл плеера
+                log.exception("Ошибка при создании источника трека %s", track.title)
+                self.current_track = None
+                self.save_state()
+                await self._channel.send(f"❌ Ошибка при загрузке трека **{track.title}**: {str(e)}")
+                continue
+
+            # Позиция продолжения нужна только для первого запуска трека
+            track.start = 0.0
+            
+            # Учитываем воспроизведение: популярные и повторяемые треки сохраняются на диск в фоне,
+            # чтобы повторы шли из файла, а не из сети
+            if not resuming:
+                audio_cache.record_play(
+                    track,
+                    ffmpeg_path=self._cog.ffmpeg_path,
+                    force=self.loop == LOOP_TRACK
+                )
+                # Громкость трека из аудиокэша измеряется в фоне и применяется со следующего воспроизведения
+                loudness_cache.ensure(track, ffmpeg_path=self._cog.ffmpeg_path)
+            
             # Сохраняем текущий трек
             self.current = source
+            self.save_state()
             
             # Воспроизводим трек
             try:
+                if not resuming:
+                    TRACK_TRANSITION.observe(time.perf_counter() - taken_at, prefetched=prefetched)
+                source.play_started_at = time.perf_counter()
                 self._guild.voice_client.play(
                     source, 
                     after=lambda error: self.bot.loop.call_soon_threadsafe(
@@ -57,16 +168,28 @@ class MusicPlayer:
                 )
                 
                 # Отображаем информацию о треке
-                self.np = await self._channel.send(
-                    f'🎵 Сейчас играет: **{source.title}**{source.duration_string}'
-                )
+                if not resuming:
+                    with DISCORD_MESSAGES.time(op='send'):
+                        self.np = await self._channel.send(
+                            f'🎵 Сейчас играет: **{source.title}**{source.duration_string}'
+                        )
+                
+                # Ждем завершения трека, периодически сохраняя позицию воспроизведения
+                await self._wait_track_end()
                 
-                # Ждем завершения трека
-                await self.next.wait()
+                restart_at = self._restart_position(track, source)
+                if restart_at is not None:
+                    # Трек продолжается с нужной позиции новым процессом FFmpeg (перемотка на входе через -ss)
+                    track.start = restart_at
+                    self._resume = True
+                    self.queue.appendleft(track)
                 
-                # Если включен повтор трека, добавляем его снова в очередь
-                if self.loop and self.current:
-                    await self.queue.put(self.current)
+                # При повторе возвращаем в очередь описание трека: источник после
+                # воспроизведения уже закрыт, а описание можно воспроизвести снова
+                elif self.loop == LOOP_TRACK and not self.skipped:
+                    self.queue.appendleft(track)
+                elif self.loop == LOOP_QUEUE:
+                    self.queue.append(track)
             
             except Exception as e:
                 await self._channel.send(f"❌ Ошибка воспроизведения: {str(e)}")
@@ -74,12 +197,271 @@ class MusicPlayer:
             
             finally:
                 # Очищаем ресурсы
-                if hasattr(source, 'cleanup'):
-                    source.cleanup()
+                source.cleanup()
                 self.current = None
+                self.current_track = None
+                self.save_state()
         
         return None
+    
+    async def _wait_track_end(self):
+        """Ждет завершения текущего трека, сохраняя состояние каждые STATE_SAVE_INTERVAL секунд.
 
+        При включенном наложении заранее запускает следующий трек.
+        """
+        while True:
+            delay = self._crossfade_delay()
+            wait = STATE_SAVE_INTERVAL if delay is None else max(min(delay, STATE_SAVE_INTERVAL), 0)
+            try:
+                await asyncio.wait_for(self.next.wait(), wait)
+                return
+            except asyncio.TimeoutError:
+                self.save_state()
+                if delay is not None and delay <= wait:
+                    await self._prepare_crossfade()
+    
+    def _crossfade_delay(self):
+        """Через сколько секунд запускать следующий трек для наложения (None - наложение не нужно)."""
+        source = self.current
+        if (not DSP_CROSSFADE or not isinstance(source, DSPSource) or not source.duration
+                or source is self._crossfade_checked or self.loop == LOOP_TRACK):
+            return None
+        return source.duration - DSP_CROSSFADE - DSP_CROSSFADE_PREPARE - source.position
+    
+    async def _prepare_crossfade(self):
+        """Запускает источник следующего трека и накладывает его начало на конец текущего."""
+        source = self._crossfade_checked = self.current
+        upcoming = self.queue.upcoming(1)
+        if not upcoming:
+            return
+        
+        next_track = upcoming[0]
+        try:
+            next_source = await YTDLSource.from_track(
+                next_track,
+                ffmpeg_path=self._cog.ffmpeg_path,
+                guild_id=self.guild_id,
+                volume=self.volume
+            )
+        except (ExtractorBusyError, ValueError) as e:
+            log.debug("Наложение треков пропущено: %s", e)
+            return
+        
+        # Наложить можно только PCM; текущий трек мог закончиться, пока запускался следующий
+        if (self.current is not source or not isinstance(next_source, DSPSource)
+                or not source.crossfade_into(next_source, DSP_CROSSFADE)):
+            next_source.cleanup()
+            return
+        self._crossfade = (next_track, next_source)
+    
+    def _take_crossfade(self, track):
+        """Возвращает источник трека, заранее запущенный для наложения, или None."""
+        prepared, self._crossfade = self._crossfade, None
+        if prepared is None:
+            return None
+        
+        prepared_track, source = prepared
+        if prepared_track is not track:
+            # Очередь изменилась: заранее запущенный трек сейчас не играет
+            source.cleanup()
+            return None
+        
+        # Начало трека уже прозвучало при наложении на предыдущий
+        source.frames += source.mixed_samples // SAMPLES_PER_FRAME
+        return source
+    
+    def drop_crossfade(self):
+        """Закрывает источник, заранее запущенный для наложения."""
+        if self._crossfade is not None:
+            self._crossfade[1].cleanup()
+            self._crossfade = None
+
+    def _restart_position(self, track, source):
+        """Возвращает позицию, с которой трек нужно запустить заново, или None, если он завершен.
+
+        Трек запускается заново после !seek и если поток оборвался раньше конца трека
+        (истек URL потока, разорвано соединение), при этом URL потока получается заново.
+        Гильдия, отключенная от общего потока, продолжает трек с той же позиции своим процессом FFmpeg.
+        """
+        if self.seek_to is not None:
+            position, self.seek_to = self.seek_to, None
+            return position
+        
+        voice_client = self._guild.voice_client
+        if self.skipped or voice_client is None or not voice_client.is_connected():
+            return None
+        
+        # Гильдия отстала от общего потока (например, стояла на паузе): трек продолжается
+        # собственным процессом FFmpeg с той же позиции, поток при этом не считается оборванным
+        if getattr(source, 'detached', False):
+            return source.position
+        
+        # Длительность трансляций неизвестна, обрыв от окончания не отличить
+        position = source.position
+        if not track.duration or position >= track.duration - STREAM_RECOVERY_MARGIN:
+            return None
+        
+        if self._recoveries >= STREAM_RECOVERY_ATTEMPTS:
+            log.warning("Поток трека %s снова прервался на %.1f с, восстановление прекращено", track.title, position)
+            return None
+        
+        self._recoveries += 1
+        log.info("Поток трека %s прервался на %.1f с из %s, восстановление (попытка %d/%d)",
+                 track.title, position, track.duration, self._recoveries, STREAM_RECOVERY_ATTEMPTS)
+        # URL потока получаем заново и в обход кэша: старый мог быть отозван раньше срока
+        track.invalidate_stream()
+        metadata_cache.invalidate_stream(track.url)
+        return position
+    
+    def seek(self, position):
+        """Перематывает текущий трек на position секунд: FFmpeg перезапускается с этой позиции."""
+        self.seek_to = position
+        self._guild.voice_client.stop()
+    
+    def skip(self):
+        """Пропускает текущий трек (при повторе трека переходит к следующему)."""
+        self.skipped = True
+        self.seek_to = None
+        self._guild.voice_client.stop()
+    
+    def set_loop(self, mode):
+        """Устанавливает режим повтора."""
+        self.loop = mode
+        self.save_state()
+        
+        # Повторяемый трек сразу сохраняем на диск, чтобы повторы не загружали его заново
+        if mode == LOOP_TRACK and self.current_track:
+            audio_cache.ensure(self.current_track, ffmpeg_path=self._cog.ffmpeg_path)
+    
+    @property
+    def guild_id(self):
+        """ID гильдии, которой принадлежит плеер."""
+        return self._guild.id
+    
+    def upcoming(self, count):
+        """Возвращает до count ближайших треков очереди без их извлечения."""
+        return self.queue.upcoming(count)
+    
+    @property
+    def queue_full(self):
+        """Достигнут ли лимит длины очереди гильдии."""
+        return len(self.queue) >= self.max_queue
+    
+    async def enqueue(self, *items):
+        """Добавляет треки в очередь и обновляет окно предзагрузки."""
+        for item in items:
+            self.queue.append(item)
+        self.queue_changed()
+    
+    def queue_changed(self):
+        """Обновляет окно предзагрузки и сохраняет состояние после изменения очереди."""
+        self.prefetcher.schedule()
+        self.save_state()
+    
+    async def add_feed(self, feed, on_progress=None):
+        """Добавляет плейлист и ждет, пока его треки заполнят свободное место в очереди."""
+        self.feeds.append(feed)
+        await asyncio.wait({self.refill(on_progress)})
+    
+    def refill(self, on_progress=None):
+        """Запускает дополнение очереди из плейлистов, если оно еще не идет."""
+        if self._filling is None or self._filling.done():
+            self._filling = self.bot.loop.create_task(self._fill(on_progress))
+        return self._filling
+    
+    async def _fill(self, on_progress):
+        """Добавляет треки плейлистов в очередь, пока не будет достигнут ее лимит."""
+        while self.feeds and not self.queue_full:
+            feed = self.feeds[0]
+            try:
+                track = await feed.pull()
+            except Exception as e:
+                log.warning("Ошибка загрузки плейлиста %s: %s", feed.title, e)
+                track = None
+            
+            if track is None:
+                self.feeds.popleft()
+                continue
+            
+            await self.enqueue(track)
+            
+            if on_progress:
+                try:
+                    await on_progress(feed)
+                except Exception as e:
+                    log.warning("Ошибка обновления прогресса плейлиста: %s", e)
+    
+    def close_feeds(self):
+        """Прекращает загрузку всех плейлистов (например, при очистке очереди)."""
+        if self._filling:
+            self._filling.cancel()
+        for feed in self.feeds:
+            self.bot.loop.create_task(feed.close())
+        self.feeds.clear()
+    
+    def snapshot(self):
+        """Возвращает снимок текущего состояния плеера."""
+        voice_client = self._guild.voice_client
+        track = self.current_track
+        
+        if self.current is not None:
+            position = self.current.position
+        else:
+            # Трек еще запускается - сохраняем позицию, с которой он начнется
+            position = track.start if track else 0.0
+        
+        return PlayerSnapshot(
+            self.guild_id,
+            voice_client.channel.id if voice_client else None,
+            self._channel.id,
+            self.loop,
+            self.volume,
+            position=position,
+            current=track.to_dict() if track else None,
+            queue=[queued.to_dict() for queued in self.queue],
+        )
+    
+    def restore(self, snapshot):
+        """Восстанавливает очередь и настройки из снимка: текущий трек продолжится с сохраненной позиции."""
+        self.loop = snapshot.loop if snapshot.loop in LOOP_MODES else LOOP_OFF
+        self.volume = snapshot.volume
+        
+        if snapshot.current:
+            track = Track.from_dict(snapshot.current)
+            track.start = snapshot.position
+            self.queue.append(track)
+        for data in snapshot.queue:
+            self.queue.append(Track.from_dict(data))
+        
+        self.prefetcher.schedule()
+    
+    def save_state(self):
+        """Планирует сохранение состояния; несколько изменений подряд сохраняются одной записью."""
+        if self._save_handle is None:
+            self._save_handle = self.bot.loop.call_later(STATE_SAVE_DELAY, self._save_now)
+    
+    def _save_now(self):
+        self._save_handle = None
+        try:
+            state_store.save_later(self.snapshot())
+        except Exception:
+            log.exception("Ошибка сохранения состояния плеера")
+    
+    def cancel_save(self):
+        """Отменяет запланированное сохранение (плеер уничтожается)."""
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+    
+    async def stop(self):
+        """Останавливает цикл плеера: треки очереди больше не запускаются, текущий источник закрывается."""
+        task = self._loop_task
+        # Цикл сам вызывает очистку по тайм-ауту и к этому моменту уже завершается
+        if task.done() or task is asyncio.current_task():
+            return
+        task.cancel()
+        await asyncio.wait({task})
+    
     def destroy(self, guild):
         """Уничтожает плеер и отключается от голосового канала."""
         return self.bot.loop.create_task(self._cog.cleanup(guild))
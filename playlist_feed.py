@@ -0,0 +1,41 @@
+"""
+Модуль постепенной загрузки плейлистов в очередь.
+Плейлист не добавляется в очередь целиком: треки извлекаются по страницам
+и добавляются по мере того, как в очереди гильдии освобождается место.
+"""
+
+from resolver import iter_playlist
+
+
+class PlaylistFeed:
+    """Источник треков одного плейлиста для очереди плеера."""
+
+    __slots__ = ('title', 'total', 'added', 'exhausted', 'requester', '_tracks')
+
+    def __init__(self, handle, *, guild_id=None, requester=None):
+        self.title = handle.title
+        self.total = handle.total
+        self.added = 0  # Сколько треков уже добавлено в очередь
+        self.exhausted = False
+        self.requester = requester  # Имя пользователя, добавившего плейлист
+        self._tracks = iter_playlist(handle, guild_id=guild_id)
+
+    async def pull(self):
+        """Возвращает следующий трек плейлиста или None, если плейлист закончился."""
+        if self.exhausted:
+            return None
+
+        track = await anext(self._tracks, None)
+        if track is None:
+            self.exhausted = True
+        else:
+            track.requester = self.requester
+            self.added += 1
+        return track
+
+    async def close(self):
+        """Прекращает загрузку плейлиста и отменяет начатые извлечения."""
+        self.exhausted = True
+        # Генератор, который сейчас ожидает извлечения, завершится при отмене ожидающей задачи
+        if not self._tracks.ag_running:
+            await self._tracks.aclose()
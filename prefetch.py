@@ -0,0 +1,101 @@
+"""
+Модуль предзагрузки следующих треков очереди.
+Пока играет текущий трек, получает URL потоков для ближайших треков,
+чтобы переход между треками не ждал извлечения yt-dlp.
+"""
+
+import asyncio
+import logging
+import time
+from config import PREFETCH_DEPTH, PREFETCH_EXPIRY_MARGIN
+from ytdl_source import YTDLSource
+from extraction import PRIORITY_BULK
+
+log = logging.getLogger(__name__)
+
+# Минимальная пауза между повторными попытками обновить поток
+PREFETCH_RETRY_DELAY = 30
+
+
+class Prefetcher:
+    """Получает потоки для следующих треков очереди в фоне."""
+
+    __slots__ = ('_player', '_tasks', '_resolving', 'depth')
+
+    def __init__(self, player, depth=PREFETCH_DEPTH):
+        self._player = player
+        self._tasks = {}  # id трека -> задача поддержания потока в актуальном состоянии
+        self._resolving = {}  # id трека -> текущая задача получения потока
+        self.depth = depth
+
+    def schedule(self):
+        """Обновляет окно предзагрузки по текущему содержимому очереди."""
+        window = self._player.upcoming(self.depth)
+        keys = {id(track) for track in window}
+
+        # Отменяем предзагрузку треков, которые покинули окно (пропущены или удалены)
+        for key in list(self._tasks):
+            if key not in keys:
+                self._cancel(key)
+
+        for track in window:
+            key = id(track)
+            if key not in self._tasks:
+                self._tasks[key] = self._player.bot.loop.create_task(self._keep_fresh(track))
+
+    async def take(self, track):
+        """Забирает трек из окна перед воспроизведением, дожидаясь начатой предзагрузки."""
+        key = id(track)
+        task = self._tasks.pop(key, None)
+        if task:
+            task.cancel()
+
+        resolving = self._resolving.pop(key, None)
+        if resolving and not resolving.done():
+            try:
+                await resolving
+            except Exception:
+                # Ошибку покажет повторная попытка в плеере
+                pass
+
+    def cancel_all(self):
+        """Отменяет всю предзагрузку (например, при очистке очереди)."""
+        for key in list(self._tasks):
+            self._cancel(key)
+
+    def _cancel(self, key):
+        task = self._tasks.pop(key, None)
+        if task:
+            task.cancel()
+
+        resolving = self._resolving.pop(key, None)
+        if resolving:
+            resolving.cancel()
+
+    async def _keep_fresh(self, track):
+        """Получает поток для трека и обновляет его незадолго до истечения."""
+        key = id(track)
+        loop = self._player.bot.loop
+
+        while True:
+            if not track.has_fresh_stream(PREFETCH_EXPIRY_MARGIN):
+                resolving = loop.create_task(YTDLSource.resolve_track(
+                    track,
+                    guild_id=self._player.guild_id,
+                    priority=PRIORITY_BULK
+                ))
+                self._resolving[key] = resolving
+                try:
+                    # Защищаем извлечение от отмены, чтобы take() мог дождаться результата
+                    await asyncio.shield(resolving)
+                except Exception as e:
+                    log.warning("Ошибка предзагрузки трека %s: %s", track.title, e)
+                    await asyncio.sleep(PREFETCH_RETRY_DELAY)
+                    continue
+                finally:
+                    if self._resolving.get(key) is resolving and resolving.done():
+                        del self._resolving[key]
+
+            # Ждем момента, когда поток снова потребуется обновить
+            delay = track.expires_at - PREFETCH_EXPIRY_MARGIN - time.time()
+            await asyncio.sleep(max(delay, PREFETCH_RETRY_DELAY))
@@ -0,0 +1,97 @@
+"""
+Модуль упреждающего чтения PCM.
+Отдельный поток заранее читает вывод FFmpeg в кольцевой буфер фиксированного размера,
+поэтому поток отправки голосового клиента берет кадры из памяти и не ждет канал FFmpeg,
+когда процессор занят или сеть ненадолго замедлилась.
+"""
+
+import logging
+import threading
+from metrics import READAHEAD_UNDERRUNS, READAHEAD_FULL
+
+log = logging.getLogger(__name__)
+
+
+class ReadAheadBuffer:
+    """Кольцевой буфер, который поток-читатель заполняет из канала FFmpeg порциями по chunk_size байт.
+
+    Размер буфера округляется вверх до целого числа порций (не меньше двух), память выделяется один раз.
+    """
+
+    def __init__(self, stream, capacity, *, chunk_size):
+        chunks = max(-(-capacity // chunk_size), 2)
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._capacity = chunks * chunk_size
+        self._buffer = bytearray(self._capacity)
+        self._view = memoryview(self._buffer)
+        self._read_pos = 0  # Начало непрочитанных данных
+        self._size = 0  # Непрочитанные байты
+        self._started = False  # Данные уже отдавались: ожидание после этого считается опустошением
+        self._finished = False
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._fill, daemon=True, name=f'readahead:{id(self):#x}')
+        self._thread.start()
+
+    def read(self, size):
+        """Возвращает до size байт; меньше - только в конце потока."""
+        size = min(size, self._capacity)
+        with self._condition:
+            if self._size < size and not (self._finished or self._closed):
+                if self._started:
+                    READAHEAD_UNDERRUNS.inc()
+                while self._size < size and not (self._finished or self._closed):
+                    self._condition.wait()
+
+            count = min(size, self._size)
+            end = self._read_pos + count
+            if end <= self._capacity:
+                data = bytes(self._view[self._read_pos:end])
+            else:
+                data = bytes(self._view[self._read_pos:]) + bytes(self._view[:end - self._capacity])
+            self._read_pos = end % self._capacity
+            self._size -= count
+            self._started = self._started or count > 0
+            self._condition.notify_all()
+            return data
+
+    def close(self):
+        """Останавливает поток-читатель (канал FFmpeg закрывает сам аудио-источник)."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def _fill(self):
+        """Читает канал FFmpeg в свободную часть буфера, пока поток не закончится или буфер не закроют."""
+        try:
+            while True:
+                with self._condition:
+                    if self._capacity - self._size < self._chunk_size and not self._closed:
+                        # Буфер полон - обычное состояние при воспроизведении: ждем, пока кадры заберут.
+                        # Данные при этом не теряются, поэтому это не ошибка, а показатель заполненности
+                        READAHEAD_FULL.inc()
+                        while self._capacity - self._size < self._chunk_size and not self._closed:
+                            self._condition.wait()
+                        READAHEAD_FULL.dec()
+                    if self._closed:
+                        return
+                    start = (self._read_pos + self._size) % self._capacity
+
+                # Эта часть буфера свободна, поэтому канал читается без блокировки
+                count = self._stream.readinto(self._view[start:start + self._chunk_size])
+                if not count:
+                    return
+
+                with self._condition:
+                    self._size += count
+                    self._condition.notify_all()
+
+        except (OSError, ValueError) as e:
+            # Канал закрыт при остановке источника
+            log.debug("Упреждающее чтение остановлено: %s", e)
+
+        finally:
+            with self._condition:
+                self._finished = True
+                self._condition.notify_all()
@@ -0,0 +1,235 @@
+"""
+Модуль разбора запросов пользователя.
+Выполняет одно извлечение на запрос и возвращает типизированный результат:
+одиночный трек, плейлист или результат поиска. Плейлисты читаются по страницам.
+"""
+
+import asyncio
+import logging
+from urllib.parse import urlparse, parse_qs
+from config import PLAYLIST_RESOLVE_CONCURRENCY, PLAYLIST_PAGE_SIZE, PLAYLIST_PAGE_RETRY_DELAY
+from extraction import ExtractorBusyError, PRIORITY_BULK
+from metadata_cache import metadata_cache
+from track import Track, compact_info
+from ytdl_pool import PROFILE_RESOLVE
+from ytdl_source import YTDLSource
+
+log = logging.getLogger(__name__)
+
+
+class SingleTrack:
+    """Ссылка на одиночное видео, поток уже получен."""
+
+    __slots__ = ('track',)
+
+    def __init__(self, track):
+        self.track = track
+
+
+class SearchResult:
+    """Первый результат поиска по текстовому запросу."""
+
+    __slots__ = ('query', 'track')
+
+    def __init__(self, query, track):
+        self.query = query
+        self.track = track
+
+
+class PlaylistHandle:
+    """Плейлист: название и первая страница плоских записей (треки получаются через iter_playlist)."""
+
+    __slots__ = ('url', 'title', 'entries', 'next_start', 'total')
+
+    def __init__(self, url, title, entries, next_start=None, total=None):
+        self.url = url
+        self.title = title
+        self.entries = entries
+        self.next_start = next_start  # Номер первой записи следующей страницы или None, если страниц больше нет
+        self.total = total  # Число записей в плейлисте, если yt-dlp его сообщил
+
+
+def has_playlist(url):
+    """Есть ли в ссылке плейлист (параметр list, в том числе у видео в составе плейлиста)."""
+    return 'list' in parse_qs(urlparse(url).query)
+
+
+def track_from_data(data):
+    """Создает трек из полных данных yt-dlp, сохраняя полученный URL потока."""
+    track = Track.from_entry(data)
+    if track is None:
+        raise ValueError("Не удалось получить ссылку на трек")
+
+    stream_url = data.get('url')
+    if stream_url and stream_url != track.url:
+        track.set_stream(stream_url, data.get('acodec'))
+    return track
+
+
+def entry_url(entry):
+    """Возвращает ссылку, по которой можно извлечь запись плейлиста, или None."""
+    url = entry.get('webpage_url') or entry.get('url')
+    if url:
+        return url
+
+    # Плоские записи YouTube иногда содержат только ID видео
+    if entry.get('id') and entry.get('ie_key') in (None, 'Youtube'):
+        return f"https://www.youtube.com/watch?v={entry['id']}"
+    return None
+
+
+def entry_is_complete(entry):
+    """Проверяет, что по плоской записи можно создать трек без дополнительного извлечения."""
+    return bool((entry.get('webpage_url') or entry.get('url')) and entry.get('title'))
+
+
+def page_from_data(data, start):
+    """Возвращает записи страницы плейлиста и номер первой записи следующей страницы."""
+    raw_entries = data.get('entries') or []
+
+    entries = []
+    for i, entry in enumerate(raw_entries, start):
+        if entry is None:
+            log.info("Пропуск пустой записи #%d", i)
+            continue
+
+        if entry_url(entry) is None:
+            log.info("Пропуск трека #%d: не найден URL", i)
+            continue
+
+        entries.append(entry)
+
+    # Неполная страница - последняя
+    next_start = start + len(raw_entries) if len(raw_entries) >= PLAYLIST_PAGE_SIZE else None
+    return entries, next_start
+
+
+def playlist_from_data(url, data):
+    """Собирает описание плейлиста из первой страницы плоского результата извлечения."""
+    entries, next_start = page_from_data(data, 1)
+    log.debug("Найдено %d треков на первой странице плейлиста", len(entries))
+    return PlaylistHandle(
+        url,
+        data.get('title') or 'Плейлист',
+        entries,
+        next_start=next_start,
+        total=data.get('playlist_count'),
+    )
+
+
+async def fetch_playlist_page(url, start, *, guild_id=None):
+    """Извлекает следующую страницу плейлиста, начиная с записи start."""
+    while True:
+        try:
+            data = await YTDLSource.extract_data(
+                url,
+                profile=PROFILE_RESOLVE,
+                guild_id=guild_id,
+                priority=PRIORITY_BULK,
+                params={'playliststart': start, 'playlistend': start + PLAYLIST_PAGE_SIZE - 1}
+            )
+        except ExtractorBusyError:
+            # Фоновая загрузка плейлиста может подождать, пока освободится очередь извлечения
+            await asyncio.sleep(PLAYLIST_PAGE_RETRY_DELAY)
+            continue
+
+        return page_from_data(data, start)
+
+
+async def _resolve_entry(entry, semaphore, guild_id):
+    """Извлекает полные данные записи плейлиста, у которой нет ссылки или названия."""
+    async with semaphore:
+        while True:
+            try:
+                data = await YTDLSource.extract_stream_data(
+                    entry_url(entry),
+                    guild_id=guild_id,
+                    priority=PRIORITY_BULK
+                )
+            except ExtractorBusyError:
+                # Перегрузка извлечения - не повод пропускать трек: повторяем, как и для страниц
+                await asyncio.sleep(PLAYLIST_PAGE_RETRY_DELAY)
+                continue
+
+            return track_from_data(data)
+
+
+async def iter_playlist(handle, *, guild_id=None, concurrency=PLAYLIST_RESOLVE_CONCURRENCY):
+    """Выдает треки плейлиста в исходном порядке, загружая его по страницам.
+
+    Полные записи превращаются в треки сразу, неполные извлекаются параллельно
+    (не более concurrency одновременно), пока вызывающий код обрабатывает
+    предыдущие треки. Следующая страница запрашивается, только когда текущая
+    выдана целиком, поэтому в памяти хранится не больше одной страницы записей.
+    Записи, которые не удалось извлечь, пропускаются; при перегрузке извлечения запрос повторяется.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+
+    # Первая страница больше не нужна описанию плейлиста после начала обхода
+    entries, handle.entries = handle.entries, []
+    next_start = handle.next_start
+    pending = []
+
+    try:
+        while entries:
+            # Задачи для неполных записей создаем заранее, семафор ограничивает их одновременность
+            pending = [
+                None if entry_is_complete(entry) else loop.create_task(_resolve_entry(entry, semaphore, guild_id))
+                for entry in entries
+            ]
+
+            for entry, task in zip(entries, pending):
+                if task is None:
+                    yield Track.from_entry(entry)
+                    continue
+
+                try:
+                    yield await task
+                except Exception as e:
+                    log.info("Пропуск трека %s: %s", entry_url(entry), e)
+
+            if next_start is None:
+                break
+
+            try:
+                entries, next_start = await fetch_playlist_page(handle.url, next_start, guild_id=guild_id)
+            except ValueError as e:
+                log.warning("Не удалось загрузить следующую страницу плейлиста %s: %s", handle.url, e)
+                break
+
+    finally:
+        # Потребитель мог остановиться раньше (например, !play берет только первый трек)
+        for task in pending:
+            if task is not None:
+                task.cancel()
+
+
+async def resolve(query, *, guild_id=None):
+    """Разбирает ссылку или поисковый запрос за одно извлечение."""
+    query = query.strip()
+
+    # Текстовый запрос: поиск первого подходящего трека
+    if not query.startswith(('http://', 'https://')):
+        data = await YTDLSource.extract_stream_data(query, guild_id=guild_id)
+        return SearchResult(query, track_from_data(data))
+
+    # Ссылка watch?v=X&list=... попадает в кэш под ID видео X, но означает плейлист
+    if not has_playlist(query):
+        cached = metadata_cache.lookup(query)
+        if cached and 'url' in cached:
+            return SingleTrack(track_from_data(cached))
+
+    # Одно извлечение определяет тип ссылки: плейлист разбирается плоско, видео - полностью
+    log.debug("Разбор ссылки: %s", query)
+    data = await YTDLSource.extract_data(query, profile=PROFILE_RESOLVE, guild_id=guild_id)
+
+    if 'entries' in data:
+        return playlist_from_data(query, data)
+
+    if not data.get('url'):
+        raise ValueError("Не удалось получить URL потока")
+
+    data = compact_info(data)
+    metadata_cache.store(query, data)
+    return SingleTrack(track_from_data(data))
@@ -0,0 +1,105 @@
+"""
+Модуль общей статистики рабочих процессов.
+Каждый процесс, запущенный launcher.py, периодически записывает свою статистику
+в общую базу SQLite, откуда ее читают супервизор и команда !stats.
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from config import SHARD_STATS_DB_PATH, SHARD_STATS_INTERVAL
+from extraction import extraction_scheduler
+
+log = logging.getLogger(__name__)
+
+# Записи процессов, не обновлявшиеся дольше этого срока, считаются устаревшими
+STALE_FACTOR = 3
+
+
+class ShardStatsStore:
+    """Хранилище статистики рабочих процессов в SQLite."""
+
+    def __init__(self, path=SHARD_STATS_DB_PATH):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS worker_stats (
+                worker_id INTEGER PRIMARY KEY,
+                pid INTEGER,
+                shards TEXT,
+                guilds INTEGER,
+                players INTEGER,
+                queued INTEGER,
+                extractions INTEGER,
+                failed INTEGER,
+                rejected INTEGER,
+                avg_wait REAL,
+                latency REAL,
+                updated_at REAL
+            )
+        """)
+        self._db.commit()
+
+    def publish(self, worker_id, *, shards, guilds, players, queued, extractions, failed, rejected,
+                avg_wait, latency):
+        """Записывает статистику процесса, заменяя предыдущую."""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO worker_stats VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (worker_id, os.getpid(), ','.join(map(str, shards)), guilds, players, queued,
+                 extractions, failed, rejected, avg_wait, latency, time.time())
+            )
+            self._db.commit()
+
+    def workers(self):
+        """Возвращает актуальные записи процессов в виде словарей."""
+        with self._lock:
+            cursor = self._db.execute(
+                "SELECT * FROM worker_stats WHERE updated_at > ? ORDER BY worker_id",
+                (time.time() - SHARD_STATS_INTERVAL * STALE_FACTOR,)
+            )
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def clear(self):
+        """Удаляет записи всех процессов (при запуске супервизора)."""
+        with self._lock:
+            self._db.execute("DELETE FROM worker_stats")
+            self._db.commit()
+
+
+async def publish_loop(bot, worker_id):
+    """Периодически публикует статистику этого процесса."""
+    await bot.wait_until_ready()
+
+    while not bot.is_closed():
+        music = bot.get_cog('Music')
+        players = music.players.values() if music else ()
+        stats = extraction_scheduler.stats
+        avg_wait, _ = stats.averages()
+
+        try:
+            shard_stats.publish(
+                worker_id,
+                shards=sorted(bot.shards) if bot.shard_count else [],
+                guilds=len(bot.guilds),
+                players=len(players),
+                queued=sum(len(player.queue) for player in players),
+                extractions=stats.completed,
+                failed=stats.failed,
+                rejected=stats.rejected,
+                avg_wait=avg_wait,
+                latency=bot.latency,
+            )
+        except sqlite3.Error as e:
+            log.warning("Не удалось опубликовать статистику процесса: %s", e)
+
+        await asyncio.sleep(SHARD_STATS_INTERVAL)
+
+
+# Общее хранилище статистики процессов
+shard_stats = ShardStatsStore()
@@ -0,0 +1,122 @@
+"""
+Модуль сохранения состояния плееров.
+Очередь, текущий трек, позиция воспроизведения, режим повтора и громкость
+каждой гильдии сохраняются в SQLite, чтобы после перезапуска бот продолжил с того же места.
+Запись выполняется отдельным потоком, а не в цикле событий.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import STATE_DB_PATH, STATE_MAX_AGE
+
+log = logging.getLogger(__name__)
+
+
+class PlayerSnapshot:
+    """Сохраненное состояние плеера одной гильдии."""
+
+    __slots__ = ('guild_id', 'voice_channel_id', 'text_channel_id', 'loop', 'volume',
+                 'position', 'current', 'queue')
+
+    def __init__(self, guild_id, voice_channel_id, text_channel_id, loop, volume,
+                 position=0.0, current=None, queue=()):
+        self.guild_id = guild_id
+        self.voice_channel_id = voice_channel_id
+        self.text_channel_id = text_channel_id
+        self.loop = loop
+        self.volume = volume
+        self.position = position  # Позиция в текущем треке (секунды)
+        self.current = current  # Текущий трек (словарь Track.to_dict()) или None
+        self.queue = list(queue)  # Треки очереди (словари Track.to_dict())
+
+
+class StateStore:
+    """Хранилище снимков состояния плееров в SQLite."""
+
+    def __init__(self, path=STATE_DB_PATH, *, max_age=STATE_MAX_AGE):
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        # Один поток записи: снимки и удаления гильдии выполняются в порядке вызовов
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='state-store')
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS player_state (
+                guild_id INTEGER PRIMARY KEY,
+                voice_channel_id INTEGER,
+                text_channel_id INTEGER,
+                loop TEXT,
+                volume REAL,
+                position REAL,
+                current TEXT,
+                queue TEXT,
+                updated_at REAL
+            )
+        """)
+        self._db.commit()
+
+    def save(self, snapshot):
+        """Сохраняет снимок состояния гильдии, заменяя предыдущий."""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO player_state VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (snapshot.guild_id, snapshot.voice_channel_id, snapshot.text_channel_id,
+                 snapshot.loop, snapshot.volume, snapshot.position,
+                 json.dumps(snapshot.current, ensure_ascii=False) if snapshot.current else None,
+                 json.dumps(snapshot.queue, ensure_ascii=False), time.time())
+            )
+            self._db.commit()
+
+    def delete(self, guild_id):
+        """Удаляет снимок гильдии (плеер остановлен пользователем или по таймауту)."""
+        with self._lock:
+            self._db.execute("DELETE FROM player_state WHERE guild_id = ?", (guild_id,))
+            self._db.commit()
+
+    def save_later(self, snapshot):
+        """Сохраняет снимок в потоке записи (сериализация и запись в SQLite не занимают цикл событий)."""
+        self._submit(self.save, snapshot)
+
+    def delete_later(self, guild_id):
+        """Удаляет снимок гильдии в потоке записи, после ранее запланированных сохранений."""
+        self._submit(self.delete, guild_id)
+
+    def _submit(self, func, *args):
+        def run():
+            try:
+                func(*args)
+            except Exception:
+                log.exception("Ошибка записи состояния плеера")
+        self._writer.submit(run)
+
+    def load_all(self):
+        """Возвращает снимки гильдий, сохраненные не раньше max_age секунд назад."""
+        with self._lock:
+            # Устаревшие снимки восстанавливать уже не нужно
+            self._db.execute("DELETE FROM player_state WHERE updated_at < ?", (time.time() - self._max_age,))
+            self._db.commit()
+            rows = self._db.execute(
+                "SELECT guild_id, voice_channel_id, text_channel_id, loop, volume, position, current, queue "
+                "FROM player_state ORDER BY updated_at DESC"
+            ).fetchall()
+
+        snapshots = []
+        for guild_id, voice_channel_id, text_channel_id, loop, volume, position, current, queue in rows:
+            try:
+                snapshots.append(PlayerSnapshot(
+                    guild_id, voice_channel_id, text_channel_id, loop, volume,
+                    position=position or 0.0,
+                    current=json.loads(current) if current else None,
+                    queue=json.loads(queue or '[]'),
+                ))
+            except ValueError as e:
+                log.warning("Пропуск поврежденного состояния гильдии %s: %s", guild_id, e)
+        return snapshots
+
+
+# Общее хранилище состояния для всего бота
+state_store = StateStore()
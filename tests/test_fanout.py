@@ -0,0 +1,79 @@
+"""
+Тесты общего потока: гильдия на паузе не должна задерживать остальные гильдии.
+"""
+
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fanout import FanoutHub
+
+
+class FakeOpusSource:
+    """Источник с заданным числом пакетов вместо процесса FFmpeg."""
+
+    def __init__(self, packets):
+        self._packets = packets
+        self._sent = 0
+        self.cleaned_up = threading.Event()
+
+    def read(self):
+        if self._sent >= self._packets:
+            return b''
+        self._sent += 1
+        return b'packet %d' % self._sent
+
+    def cleanup(self):
+        self.cleaned_up.set()
+
+
+class SharedStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        # 50 пакетов опережения и отставания, 10 пакетов окна подключения
+        self.hub = FanoutHub(buffer_seconds=1, join_window=0.2)
+        self.source = FakeOpusSource(3000)
+        self.playing = self.hub.open('track', lambda: self.source, {'title': 'Трек'})
+        self.paused = self.hub.attach('track', {'title': 'Трек'})
+        self.assertIsNotNone(self.paused)
+
+    def test_paused_reader_does_not_stall_others(self):
+        # Первая гильдия играет трек до конца, вторая стоит на паузе после первых пакетов
+        for _ in range(5):
+            self.assertTrue(self.paused.read())
+
+        packets = []
+        while True:
+            packet = self.playing.read()
+            if not packet:
+                break
+            packets.append(packet)
+
+        self.assertEqual(len(packets), 3000)
+        self.assertEqual(packets[-1], b'packet 3000')
+        self.assertEqual(self.playing.position, 3000 * 0.02)
+
+        # Отставшая гильдия отключена от общего потока и продолжит трек со своей позиции
+        self.assertTrue(self.paused.detached)
+        self.assertEqual(self.paused.read(), b'')
+        self.assertEqual(self.paused.frames, 5)
+
+        self.playing.cleanup()
+        self.paused.cleanup()
+        self.assertTrue(self.source.cleaned_up.wait(1))
+
+    def test_buffer_stays_bounded(self):
+        for _ in range(2000):
+            self.assertTrue(self.playing.read())
+        stream = self.playing._stream
+        # В буфере не больше отставания и опережения самого быстрого читателя
+        self.assertLessEqual(len(stream._frames), 2 * 50 + 1)
+        self.playing.cleanup()
+        self.paused.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+"""
+Модуль с описанием трека в очереди.
+Track хранит только метаданные, аудио-источник создается непосредственно перед воспроизведением.
+TrackMetadata - общие сведения о треке для аудио-источников.
+"""
+
+import sys
+import time
+from urllib.parse import urlparse, parse_qs
+from config import STREAM_URL_TTL
+from metrics import FIRST_FRAME
+
+# Поля данных yt-dlp, которые бот использует после извлечения
+# (extractor и ext нужны только для имени файла при скачивании)
+INFO_FIELDS = ('id', 'title', 'duration', 'webpage_url', 'url', 'acodec', 'extractor', 'ext')
+
+# Длительность одного аудиокадра Discord в секундах
+FRAME_DURATION = 0.02
+
+
+def compact_info(data):
+    """Оставляет от данных yt-dlp только используемые поля.
+
+    Полный словарь содержит списки форматов, миниатюр, субтитров и HTTP-заголовки
+    и весит в сотни раз больше, поэтому после извлечения он не сохраняется.
+    """
+    return {key: data[key] for key in INFO_FIELDS if data.get(key) is not None}
+
+
+def stream_expiry(stream_url):
+    """Определяет время истечения подписанного URL потока (параметр expire)."""
+    expire = parse_qs(urlparse(stream_url).query).get('expire')
+    if expire:
+        try:
+            return float(expire[0])
+        except ValueError:
+            pass
+
+    # Для источников без явного срока действия используем значение по умолчанию
+    return time.time() + STREAM_URL_TTL
+
+
+class Track:
+    """Легковесное описание трека без аудио-источника."""
+
+    __slots__ = ('id', 'title', 'url', 'duration', 'requester', 'start',
+                 'stream_url', 'expires_at', 'codec')
+
+    def __init__(self, title, url, duration=0, *, video_id=None, requester=None):
+        self.id = video_id  # ID видео у источника, если известен
+        self.title = title
+        self.url = url
+        self.duration = int(duration or 0)
+        self.requester = requester  # Имя пользователя, добавившего трек
+        self.start = 0.0  # С какой секунды начать воспроизведение (например, после перезапуска бота)
+        self.stream_url = None  # URL потока, если трек уже предзагружен
+        self.expires_at = 0.0  # Время истечения URL потока
+        self.codec = None  # Аудиокодек потока, если известен (например, 'opus')
+
+    @classmethod
+    def from_entry(cls, entry):
+        """Создает трек из записи плейлиста yt-dlp (в том числе плоской)."""
+        url = entry.get('webpage_url') or entry.get('url')
+        if not url:
+            return None
+
+        return cls(
+            title=entry.get('title') or 'Неизвестный трек',
+            url=url,
+            duration=entry.get('duration'),
+            video_id=entry.get('id'),
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        """Восстанавливает трек из сохраненного состояния."""
+        return cls(
+            title=data['title'],
+            url=data['url'],
+            duration=data.get('duration'),
+            video_id=data.get('id'),
+            requester=data.get('requester'),
+        )
+
+    def to_dict(self):
+        """Возвращает описание трека для сохранения (без URL потока, он успеет истечь)."""
+        return {
+            'id': self.id,
+            'title': self.title,
+            'url': self.url,
+            'duration': self.duration,
+            'requester': self.requester,
+        }
+
+    def set_stream(self, stream_url, codec=None):
+        """Запоминает полученный URL потока, его кодек и срок действия."""
+        self.stream_url = stream_url
+        self.expires_at = stream_expiry(stream_url)
+        self.codec = codec
+
+    def has_fresh_stream(self, margin=0):
+        """Проверяет, что URL потока получен и не истечет в ближайшие margin секунд."""
+        return bool(self.stream_url) and self.expires_at - margin > time.time()
+
+    def invalidate_stream(self):
+        """Помечает URL потока устаревшим: перед следующим воспроизведением он будет получен заново."""
+        self.expires_at = 0
+
+    def memory_size(self):
+        """Оценивает занимаемую треком память в байтах (вместе со строками полей)."""
+        size = sys.getsizeof(self)
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if value is not None:
+                size += sys.getsizeof(value)
+        return size
+
+    @property
+    def duration_string(self):
+        """Возвращает длительность трека в формате MM:SS."""
+        if not self.duration:
+            return ""
+
+        minutes = self.duration // 60
+        seconds = self.duration % 60
+        return f" [{minutes}:{seconds:02d}]"
+
+
+class TrackMetadata:
+    """Сведения о треке, общие для всех видов аудио-источников.
+
+    Считает выданные кадры, чтобы знать текущую позицию воспроизведения.
+    """
+
+    frames = 0  # Номер следующего кадра от начала трека
+    play_started_at = None  # Момент передачи источника голосовому клиенту (для метрики первого кадра)
+
+    def read(self):
+        data = super().read()
+        if data:
+            self._count_frame()
+        return data
+
+    def _count_frame(self):
+        self.frames += 1
+        if self.play_started_at is not None:
+            FIRST_FRAME.observe(time.perf_counter() - self.play_started_at)
+            self.play_started_at = None
+
+    @property
+    def position(self):
+        """Текущая позиция воспроизведения в секундах."""
+        return self.frames * FRAME_DURATION
+
+    def _set_metadata(self, data):
+        # Сам словарь data не сохраняем: источнику нужны только эти поля
+        self.title = data.get('title', 'Неизвестный трек')
+        self.url = data.get('webpage_url', data.get('url', ''))
+        self.duration = data.get('duration', 0)
+
+    @property
+    def duration_string(self):
+        """Возвращает длительность трека в формате MM:SS."""
+        if not self.duration:
+            return ""
+
+        minutes = self.duration // 60
+        seconds = self.duration % 60
+        return f" [{minutes}:{seconds:02d}]"
@@ -0,0 +1,83 @@
+"""
+Модуль очереди треков гильдии.
+Хранит легковесные описания треков и поддерживает операции команд
+управления очередью: удаление и перемещение по номеру, перемешивание и постраничный просмотр.
+"""
+
+import asyncio
+import itertools
+import random
+import sys
+from collections import deque
+
+
+class TrackQueue:
+    """Очередь треков на основе deque с асинхронным ожиданием следующего трека."""
+
+    __slots__ = ('_items', '_changed')
+
+    def __init__(self):
+        self._items = deque()
+        self._changed = asyncio.Event()  # Устанавливается при добавлении трека
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def empty(self):
+        """Проверяет, что очередь пуста."""
+        return not self._items
+
+    def append(self, track):
+        """Добавляет трек в конец очереди."""
+        self._items.append(track)
+        self._changed.set()
+
+    def appendleft(self, track):
+        """Добавляет трек в начало очереди (например, для повтора)."""
+        self._items.appendleft(track)
+        self._changed.set()
+
+    async def get(self):
+        """Забирает первый трек, дожидаясь его появления, если очередь пуста."""
+        while not self._items:
+            self._changed.clear()
+            await self._changed.wait()
+        return self._items.popleft()
+
+    def upcoming(self, count):
+        """Возвращает до count ближайших треков без их извлечения."""
+        return list(itertools.islice(self._items, count))
+
+    def page(self, number, size):
+        """Возвращает треки страницы number (с 1) по size треков на странице."""
+        start = (number - 1) * size
+        return list(itertools.islice(self._items, start, start + size))
+
+    def remove(self, index):
+        """Удаляет трек по индексу (с 0) и возвращает его."""
+        track = self._items[index]
+        del self._items[index]
+        return track
+
+    def move(self, source, destination):
+        """Перемещает трек с позиции source на позицию destination (индексы с 0)."""
+        track = self.remove(source)
+        self._items.insert(destination, track)
+        return track
+
+    def shuffle(self):
+        """Перемешивает очередь."""
+        items = list(self._items)
+        random.shuffle(items)
+        self._items = deque(items)
+
+    def memory_size(self):
+        """Оценивает занимаемую очередью память в байтах."""
+        return sys.getsizeof(self._items) + sum(track.memory_size() for track in self._items)
+
+    def clear(self):
+        """Удаляет все треки из очереди."""
+        self._items.clear()
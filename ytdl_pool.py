@@ -0,0 +1,173 @@
+"""
+Модуль пула экземпляров yt-dlp.
+Хранит долгоживущие экземпляры YoutubeDL для каждого профиля настроек,
+чтобы извлечение не инициализировало заново экстракторы, cookies и HTTP-сессии.
+"""
+
+import logging
+import threading
+import yt_dlp
+from config import (
+    YTDL_FORMAT_OPTIONS, YTDL_PLAYLIST_OPTIONS,
+    YTDL_POOL_SIZE, YTDL_POOL_MAX_USES
+)
+from logging_setup import YTDLLogger
+from connection import ssl_contexts
+
+log = logging.getLogger(__name__)
+
+# Профиль для извлечения одного трека (поиск или прямая ссылка)
+PROFILE_SINGLE = 'single'
+# Профиль для ссылок: одиночное видео извлекается полностью, плейлист - плоско (только метаданные)
+PROFILE_RESOLVE = 'resolve'
+
+# Экстракторы, которые создаются заранее при прогреве пула
+WARM_EXTRACTORS = ('Youtube', 'YoutubeTab', 'YoutubeSearch')
+
+
+def build_profiles():
+    """Собирает настройки yt-dlp для каждого профиля пула."""
+    # Вывод yt-dlp идет в журнал, а не синхронной записью в stdout из рабочих потоков
+    common = {'logger': YTDLLogger()}
+
+    single = YTDL_FORMAT_OPTIONS.copy()
+    single.update(common)
+
+    resolve = YTDL_PLAYLIST_OPTIONS.copy()
+    resolve.update(common)
+    resolve.update({
+        'noplaylist': False,  # Разрешаем обработку плейлистов
+        'extract_flat': 'in_playlist',  # Потоки треков плейлиста получаем перед воспроизведением
+    })
+
+    return {
+        PROFILE_SINGLE: single,
+        PROFILE_RESOLVE: resolve,
+    }
+
+
+class PooledExtractor:
+    """Экземпляр YoutubeDL вместе со счетчиком использований."""
+
+    __slots__ = ('ytdl', 'uses', 'healthy')
+
+    def __init__(self, options):
+        self.ytdl = yt_dlp.YoutubeDL(options)
+        # Соединения экземпляра используют общий SSL-контекст бота
+        ssl_contexts.install(self.ytdl)
+        self.uses = 0
+        self.healthy = True
+
+    def warm_up(self):
+        """Создает основные экстракторы заранее."""
+        for ie_key in WARM_EXTRACTORS:
+            try:
+                self.ytdl.get_info_extractor(ie_key)
+            except Exception as e:
+                log.warning("Не удалось прогреть экстрактор %s: %s", ie_key, e)
+
+    def close(self):
+        """Закрывает HTTP-сессии экземпляра."""
+        try:
+            self.ytdl.close()
+        except Exception as e:
+            log.warning("Ошибка при закрытии экземпляра yt-dlp: %s", e)
+
+
+class YTDLPool:
+    """Пул экземпляров YoutubeDL, которые выдаются рабочим потокам по одному."""
+
+    def __init__(self, profiles, *, size=YTDL_POOL_SIZE, max_uses=YTDL_POOL_MAX_USES):
+        self._profiles = profiles
+        self._size = size
+        self._max_uses = max_uses
+        self._condition = threading.Condition()
+        self._idle = {name: [] for name in profiles}  # Свободные экземпляры (последний - самый «теплый»)
+        self._total = {name: 0 for name in profiles}  # Всего экземпляров профиля, включая выданные
+
+    def warm_up(self):
+        """Заранее создает и прогревает экземпляры всех профилей (блокирующий вызов)."""
+        for name, options in self._profiles.items():
+            while True:
+                with self._condition:
+                    if self._total[name] >= self._size:
+                        break
+                    self._total[name] += 1
+
+                try:
+                    extractor = PooledExtractor(options)
+                    extractor.warm_up()
+                except Exception:
+                    with self._condition:
+                        self._total[name] -= 1
+                    raise
+
+                with self._condition:
+                    self._idle[name].append(extractor)
+                    self._condition.notify()
+
+        log.info("Пул yt-dlp прогрет (профилей: %d, экземпляров на профиль: %d)", len(self._profiles), self._size)
+
+    def _acquire(self, profile):
+        with self._condition:
+            while True:
+                if self._idle[profile]:
+                    return self._idle[profile].pop()
+                if self._total[profile] < self._size:
+                    self._total[profile] += 1
+                    break
+                self._condition.wait()
+
+        # Новый экземпляр создаем вне блокировки, это относительно долгая операция
+        try:
+            return PooledExtractor(self._profiles[profile])
+        except Exception:
+            with self._condition:
+                self._total[profile] -= 1
+                self._condition.notify()
+            raise
+
+    def _release(self, profile, extractor):
+        extractor.uses += 1
+
+        # Проверка состояния: сломанные и «уставшие» экземпляры заменяются новыми
+        if not extractor.healthy or extractor.uses >= self._max_uses:
+            extractor.close()
+            with self._condition:
+                self._total[profile] -= 1
+                self._condition.notify()
+            return
+
+        with self._condition:
+            self._idle[profile].append(extractor)
+            self._condition.notify()
+
+    def extract_info(self, profile, url, *, params=None, **kwargs):
+        """Извлекает информацию с помощью свободного экземпляра профиля (блокирующий вызов).
+
+        params - настройки yt-dlp, заменяющие настройки профиля только на время этого вызова
+        (например, окно playliststart/playlistend для страницы плейлиста).
+        """
+        extractor = self._acquire(profile)
+        params = params or {}
+        ytdl_params = extractor.ytdl.params
+        saved = {key: ytdl_params[key] for key in params if key in ytdl_params}
+        ytdl_params.update(params)
+        try:
+            return extractor.ytdl.extract_info(url, **kwargs)
+        except yt_dlp.utils.DownloadError:
+            # Ошибка извлечения конкретного видео не говорит о неисправности экземпляра
+            raise
+        except Exception:
+            extractor.healthy = False
+            raise
+        finally:
+            # Возвращаем настройки профиля до того, как экземпляр получит другой поток
+            for key in params:
+                ytdl_params.pop(key, None)
+            ytdl_params.update(saved)
+            self._release(profile, extractor)
+
+
+# Общий пул для всего бота
+ytdl_pool = YTDLPool(build_profiles())
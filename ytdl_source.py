@@ -4,259 +4,250 @@
 """
 
 import asyncio
+import logging
 import ssl
 import discord
-import yt_dlp
-from config import YTDL_FORMAT_OPTIONS, FFMPEG_OPTIONS
+from config import (
+    FFMPEG_OPTIONS, LOCAL_FFMPEG_OPTIONS, PREFETCH_EXPIRY_MARGIN, DEFAULT_VOLUME,
+    PLAYBACK_MODE, OPUS_BITRATE, FANOUT_ENABLED
+)
+from extraction import extraction_scheduler, ExtractorBusyError, PRIORITY_INTERACTIVE
+from metadata_cache import metadata_cache
+from ytdl_pool import ytdl_pool, PROFILE_SINGLE
+from track import TrackMetadata, compact_info, FRAME_DURATION
+from fanout import fanout_hub
+from audio_cache import audio_cache
+from loudness import loudness_cache
+from metrics import FFMPEG_SPAWN
+from dsp import DSPSource
+from ffmpeg_supervisor import ffmpeg_supervisor, KIND_STREAM, KIND_FANOUT
 
-class YTDLSource(discord.PCMVolumeTransformer):
-    """Класс для работы с аудио-источниками через yt-dlp."""
+log = logging.getLogger(__name__)
+
+class YTDLOpusSource(TrackMetadata, discord.FFmpegOpusAudio):
+    """Аудио-источник, отдающий готовые пакеты Opus без декодирования в PCM на стороне бота."""
     
-    def __init__(self, source, *, data, volume=0.5):
-        super().__init__(source, volume)
-        self.data = data
-        self.title = data.get('title', 'Неизвестный трек')
-        self.url = data.get('webpage_url', data.get('url', ''))
-        self.duration = data.get('duration', 0)
-        
-    @property
-    def duration_string(self):
-        """Возвращает длительность трека в формате MM:SS."""
-        if not self.duration:
-            return ""
+    def __init__(self, stream_url, *, data, volume=1.0, passthrough=False, executable="ffmpeg",
+                 ffmpeg_options=FFMPEG_OPTIONS):
+        options = ffmpeg_options['options']
+        if not passthrough:
+            # Громкость применяет сам FFmpeg при перекодировании в Opus
+            options += f' -filter:a volume={volume:.3f}'
         
-        minutes = self.duration // 60
-        seconds = self.duration % 60
-        return f" [{minutes}:{seconds:02d}]"
+        super().__init__(
+            stream_url,
+            bitrate=OPUS_BITRATE,
+            codec='opus' if passthrough else None,  # 'opus' означает копирование потока без перекодирования
+            executable=executable,
+            before_options=ffmpeg_options['before_options'],
+            options=options
+        )
+        self.volume = volume
+        self.passthrough = passthrough
+        self._set_metadata(data)
+
 
+class YTDLSource(TrackMetadata, DSPSource):
+    """Класс для работы с аудио-источниками через yt-dlp (PCM с обработкой громкости на стороне бота)."""
+    
+    def __init__(self, source, *, data, volume=0.5, start=0.0):
+        super().__init__(source, volume=volume, start=start, duration=data.get('duration') or 0)
+        self._set_metadata(data)
+    
     @classmethod
-    async def create_ytdl_instance(cls):
-        """Создает экземпляр YoutubeDL с актуальными настройками."""
-        ytdl_opts = YTDL_FORMAT_OPTIONS.copy()
-        # Дополнительные настройки для обхода SSL проблем
-        ytdl_opts.update({
-            'nocheckcertificate': True,
-            'no_check_certificate': True,
-            'no_check_certificates': True,
-            'prefer_insecure': True,
-            'verify_ssl': False,
-        })
-        return yt_dlp.YoutubeDL(ytdl_opts)
+    async def create_source(cls, stream_url, *, data, codec=None, ffmpeg_path="ffmpeg", volume=DEFAULT_VOLUME,
+                            local=False, start=0.0, guild_id=None, gain=1.0):
+        """Создает аудио-источник в режиме PLAYBACK_MODE с откатом на PCM, если кодек не Opus.
 
+        start - позиция (секунды), с которой начинается воспроизведение.
+        gain - множитель нормализации громкости трека (не применяется при копировании потока Opus).
+        Процесс FFmpeg запускается в пределах общего лимита; если места нет, возбуждается FFmpegBusyError.
+        """
+        with FFMPEG_SPAWN.time(mode='local' if local else PLAYBACK_MODE):
+            source = await cls._open_source(
+                stream_url, data=data, codec=codec, ffmpeg_path=ffmpeg_path, volume=volume, local=local, start=start,
+                guild_id=guild_id, gain=gain
+            )
+        # Позиция источника отсчитывается от начала трека, а не от точки запуска FFmpeg
+        source.frames = int(start / FRAME_DURATION)
+        return source
+    
     @classmethod
-    async def is_playlist(cls, url, loop=None):
-        """Проверяет, является ли URL плейлистом."""
-        if not url.startswith(('http://', 'https://')):
-            return False
-            
-        # Проверка на явный признак плейлиста в URL (параметр list)
-        if '&list=' in url or '?list=' in url:
-            print(f"Обнаружен параметр плейлиста в URL: {url}")
-            return True
-            
-        loop = loop or asyncio.get_event_loop()
-        
-        # Создаем экземпляр yt-dlp с опциями для плейлиста
-        from config import YTDL_PLAYLIST_OPTIONS
-        ytdl_opts = YTDL_PLAYLIST_OPTIONS.copy()
-        ytdl_opts.update({
-            'dump_single_json': True,
-            'quiet': False,  # Включаем вывод для отладки
-            'extract_flat': 'in_playlist',
-        })
-        ytdl = yt_dlp.YoutubeDL(ytdl_opts)
-        
-        try:
-            # Извлекаем информацию о плейлисте с полной обработкой
-            print(f"Проверка плейлиста для: {url}")
-            info = await loop.run_in_executor(
-                None, 
-                lambda: ytdl.extract_info(url, download=False, process=True)
+    async def _open_source(cls, stream_url, *, data, codec, ffmpeg_path, volume, local, start, guild_id, gain):
+        # Параметры переподключения имеют смысл только для сетевых потоков
+        ffmpeg_options = LOCAL_FFMPEG_OPTIONS if local else FFMPEG_OPTIONS
+        if start:
+            # Перемотка до открытия входа: FFmpeg не декодирует пропущенную часть
+            ffmpeg_options = dict(
+                ffmpeg_options,
+                before_options=f"{ffmpeg_options['before_options']} -ss {start:.2f}".strip()
             )
+        
+        if PLAYBACK_MODE == 'opus':
+            if codec is None:
+                # Кодек неизвестен (например, поток из кэша) - определяем его по самому потоку
+                codec, _ = await discord.FFmpegOpusAudio.probe(stream_url, executable=ffmpeg_path)
             
-            # Выводим диагностическую информацию
-            has_entries = 'entries' in info
-            entries_count = len(info.get('entries', [])) if has_entries else 0
-            print(f"Результат проверки плейлиста: есть 'entries': {has_entries}, количество: {entries_count}")
-            
-            # Проверяем, является ли это плейлистом
-            is_playlist_result = has_entries and entries_count > 0
-            print(f"URL распознан как плейлист: {is_playlist_result}")
-            return is_playlist_result
-            
-        except Exception as e:
-            print(f"Ошибка при проверке плейлиста: {e}")
-            
-            # Дополнительная проверка на параметр плейлиста в URL
-            if '&list=' in url or '?list=' in url:
-                print("URL содержит параметр list, считаем его плейлистом несмотря на ошибку")
-                return True
+            if codec == 'opus':
+                # При громкости 1.0 поток копируется без перекодирования, нормализация при этом не применяется
+                passthrough = volume == 1.0
+                volume = 1.0 if passthrough else volume * gain
+                
+                def open_opus_source():
+                    return YTDLOpusSource(
+                        stream_url,
+                        data=data,
+                        volume=volume,
+                        passthrough=passthrough,
+                        executable=ffmpeg_path,
+                        ffmpeg_options=ffmpeg_options
+                    )
+                
+                if FANOUT_ENABLED and not start:
+                    # Гильдии, начинающие тот же трек с той же громкостью, читают один процесс FFmpeg
+                    key = (data.get('webpage_url') or stream_url, volume)
+                    reader = fanout_hub.attach(key, data)
+                    if reader is not None:
+                        return reader
+                    
+                    # Процесс общего потока не принадлежит ни одной гильдии
+                    async with ffmpeg_supervisor.spawn():
+                        return fanout_hub.open(
+                            key, lambda: ffmpeg_supervisor.adopt(open_opus_source(), kind=KIND_FANOUT), data
+                        )
                 
-            return False
+                async with ffmpeg_supervisor.spawn():
+                    return ffmpeg_supervisor.adopt(open_opus_source(), guild_id=guild_id, kind=KIND_STREAM)
+        
+        async with ffmpeg_supervisor.spawn():
+            audio_source = ffmpeg_supervisor.adopt(
+                discord.FFmpegPCMAudio(stream_url, executable=ffmpeg_path, **ffmpeg_options),
+                guild_id=guild_id,
+                kind=KIND_STREAM
+            )
+        return cls(audio_source, data=data, volume=volume * gain, start=start)
+
+    @classmethod
+    async def extract_data(cls, url, *, profile=PROFILE_SINGLE, download=False, guild_id=None,
+                           priority=PRIORITY_INTERACTIVE, params=None):
+        """Выполняет одно извлечение yt-dlp с обработкой ошибок и повторными попытками."""
+        # Максимальное количество попыток
+        max_retries = 5
+        retries = 0
+        
+        while retries < max_retries:
+            try:
+                data = await extraction_scheduler.run(
+                    lambda: ytdl_pool.extract_info(profile, url, download=download, params=params),
+                    guild_id=guild_id,
+                    priority=priority
+                )
+
+                if not data:
+                    raise ValueError("Не удалось извлечь данные аудио")
+
+                return data
+
+            except ssl.SSLError as e:
+                retries += 1
+                log.warning("SSL ошибка (попытка %d/%d): %s", retries, max_retries, e)
+
+                # Пауза перед повторной попыткой
+                if retries < max_retries:
+                    await asyncio.sleep(2)
+                else:
+                    raise ValueError(f"Не удалось подключиться из-за проблем с SSL: {e}")
+
+            except ExtractorBusyError:
+                raise
+
+            except Exception as e:
+                log.warning("Ошибка при извлечении аудио: %s", e)
+                raise ValueError(f"Не удалось извлечь аудио: {e}")
     
     @classmethod
-    async def get_playlist_items(cls, url, *, loop=None, ffmpeg_path="ffmpeg"):
-        """Извлекает все треки из плейлиста."""
-        loop = loop or asyncio.get_event_loop()
+    async def extract_stream_data(cls, url, *, download=False, guild_id=None,
+                                  priority=PRIORITY_INTERACTIVE):
+        """Извлекает данные одного трека (по ссылке или поисковому запросу), используя кэш."""
+        query = url
+        if not download:
+            cached = metadata_cache.lookup(query)
+            if cached and 'url' in cached:
+                return cached
+            if cached:
+                # Метаданные известны, но поток устарел: получаем его по прямой ссылке без поиска
+                url = cached['webpage_url'] or url
         
-        # Подготавливаем специальные настройки для извлечения плейлиста
-        from config import YTDL_PLAYLIST_OPTIONS
-        ytdl_opts = YTDL_PLAYLIST_OPTIONS.copy()
-        ytdl_opts.update({
-            'noplaylist': False,  # Разрешаем обработку плейлистов
-            'extract_flat': False,  # Получаем полные данные
-            'ignoreerrors': True,   # Продолжаем при ошибках отдельных видео
-        })
+        # Преобразуем поисковый запрос в формат ytsearch, если это не URL
+        if not url.startswith(('http://', 'https://')):
+            url = f"ytsearch1:{url}"
         
-        # Создаем экземпляр yt-dlp
-        ytdl = yt_dlp.YoutubeDL(ytdl_opts)
+        data = await cls.extract_data(url, download=download, guild_id=guild_id, priority=priority)
         
-        # Сохраняем оригинальный SSL контекст
-        original_context = ssl._create_default_https_context
-        ssl._create_default_https_context = ssl._create_unverified_context
+        # Для плейлистов и результатов поиска берем только первый трек
+        if 'entries' in data:
+            entries = [entry for entry in data['entries'] if entry]
+            if not entries:
+                raise ValueError("Ничего не найдено")
+            data = entries[0]
         
-        try:
-            print(f"Получение данных плейлиста для: {url}")
-            # Извлекаем информацию о плейлисте с полной обработкой
-            data = await loop.run_in_executor(
-                None, 
-                lambda: ytdl.extract_info(url, download=False, process=True)
-            )
-            
-            if not data:
-                raise ValueError("Не удалось извлечь данные плейлиста")
-            
-            playlist_title = data.get('title', 'Плейлист')
-            print(f"Название плейлиста: {playlist_title}")
-            
-            # Получаем все треки из плейлиста
-            tracks = []
-            
-            # Проверяем наличие треков
-            if 'entries' in data:
-                entries = data['entries']
-                print(f"Найдено {len(entries)} треков в плейлисте")
-                
-                # Создаем объекты YTDLSource для каждого трека
-                for i, entry in enumerate(entries):
-                    if entry is None:
-                        print(f"Пропуск пустой записи #{i+1}")
-                        continue
-                    
-                    try:
-                        # Если это прямой URL, используем его
-                        if 'url' in entry:
-                            processed_url = entry['url']
-                        # Иначе нам нужно получить данные для потока
-                        elif 'id' in entry and 'webpage_url' in entry:
-                            entry_data = await loop.run_in_executor(
-                                None,
-                                lambda: ytdl.extract_info(entry['webpage_url'], download=False)
-                            )
-                            processed_url = entry_data.get('url')
-                        else:
-                            print(f"Пропуск трека #{i+1}: не найден URL")
-                            continue
-                            
-                        if not processed_url:
-                            print(f"Пропуск трека #{i+1}: не получен URL потока")
-                            continue
-                        
-                        # Создаем аудио-источник
-                        audio_source = discord.FFmpegPCMAudio(
-                            processed_url,
-                            executable=ffmpeg_path,
-                            **FFMPEG_OPTIONS
-                        )
-                        
-                        track = cls(audio_source, data=entry)
-                        tracks.append(track)
-                        print(f"Добавлен трек #{i+1}: {track.title}")
-                    
-                    except Exception as track_error:
-                        print(f"Ошибка при обработке трека #{i+1}: {track_error}")
-                        continue
-                
-            return playlist_title, tracks
+        data = compact_info(data)
+        metadata_cache.store(query, data)
+        return data
+    
+    @classmethod
+    async def resolve_track(cls, track, *, guild_id=None, priority=PRIORITY_INTERACTIVE):
+        """Получает URL потока для трека и запоминает его вместе со сроком действия."""
+        data = await cls.extract_stream_data(track.url, guild_id=guild_id, priority=priority)
         
-        except Exception as e:
-            print(f"Критическая ошибка при извлечении плейлиста: {e}")
-            raise ValueError(f"Не удалось извлечь плейлист: {e}")
+        stream_url = data.get('url')
+        if not stream_url:
+            raise ValueError("Не удалось получить URL потока")
         
-        finally:
-            # Восстанавливаем оригинальный SSL контекст
-            ssl._create_default_https_context = original_context
+        track.set_stream(stream_url, data.get('acodec'))
+        return track
     
     @classmethod
-    async def from_url(cls, url, *, loop=None, stream=True, ffmpeg_path="ffmpeg", process_playlist=False):
-        """Получает аудио из URL с обработкой ошибок и повторными попытками."""
-        loop = loop or asyncio.get_event_loop()
+    async def from_track(cls, track, *, ffmpeg_path="ffmpeg", guild_id=None, volume=DEFAULT_VOLUME):
+        """Создает аудио-источник для трека из очереди непосредственно перед воспроизведением.
+
+        Воспроизведение начинается с позиции track.start.
+        """
+        data = {
+            'title': track.title,
+            'webpage_url': track.url,
+            'duration': track.duration,
+        }
         
-        # Максимальное количество попыток
-        max_retries = 5
-        retries = 0
+        # Громкость трека выравнивается по результату прошлого измерения
+        gain = loudness_cache.gain(track)
         
-        # Сохраняем оригинальный SSL контекст
-        original_context = ssl._create_default_https_context
-        ssl._create_default_https_context = ssl._create_unverified_context
+        # Сохраненный на диск трек воспроизводим из файла, без сети
+        path = audio_cache.lookup(track)
+        if path:
+            return await cls.create_source(
+                path,
+                data=data,
+                codec='opus',
+                ffmpeg_path=ffmpeg_path,
+                volume=volume,
+                local=True,
+                start=track.start,
+                guild_id=guild_id,
+                gain=gain
+            )
         
-        try:
-            # Проверяем, является ли это плейлистом и нужно ли его обрабатывать
-            if process_playlist and await cls.is_playlist(url, loop=loop):
-                # Возвращаем специальный маркер, указывающий что это плейлист
-                return {'is_playlist': True, 'url': url}
-            
-            while retries < max_retries:
-                try:
-                    # Создаем экземпляр yt-dlp
-                    ytdl = await cls.create_ytdl_instance()
-                    
-                    # Преобразуем поисковый запрос в формат ytsearch, если это не URL
-                    if not url.startswith(('http://', 'https://')):
-                        url = f"ytsearch1:{url}"
-                    
-                    # Извлекаем информацию о видео
-                    data = await loop.run_in_executor(
-                        None, 
-                        lambda: ytdl.extract_info(url, download=not stream)
-                    )
-                    
-                    # Обрабатываем плейлисты, если не нужно обрабатывать весь плейлист,
-                    # берем только первый трек
-                    if data and 'entries' in data:
-                        data = data['entries'][0]
-                    
-                    if not data:
-                        raise ValueError("Не удалось извлечь данные аудио")
-                    
-                    # Получаем URL для потока или локальный путь
-                    processed_url = data.get('url') if stream else ytdl.prepare_filename(data)
-                    if not processed_url:
-                        raise ValueError("Не удалось получить URL потока")
-                    
-                    # Создаем аудио-источник
-                    audio_source = discord.FFmpegPCMAudio(
-                        processed_url,
-                        executable=ffmpeg_path,
-                        **FFMPEG_OPTIONS
-                    )
-                    
-                    return cls(audio_source, data=data)
-                
-                except ssl.SSLError as e:
-                    retries += 1
-                    print(f"SSL ошибка (попытка {retries}/{max_retries}): {e}")
-                    
-                    # Пауза перед повторной попыткой
-                    if retries < max_retries:
-                        await asyncio.sleep(2)
-                    else:
-                        raise ValueError(f"Не удалось подключиться из-за проблем с SSL: {e}")
-                
-                except Exception as e:
-                    print(f"Ошибка при извлечении аудио: {e}")
-                    raise ValueError(f"Не удалось извлечь аудио: {e}")
+        # Используем предзагруженный поток, если срок его действия еще не подходит к концу
+        if not track.has_fresh_stream(PREFETCH_EXPIRY_MARGIN):
+            await cls.resolve_track(track, guild_id=guild_id)
         
-        finally:
-            # Восстанавливаем оригинальный SSL контекст
-            ssl._create_default_https_context = original_context
+        return await cls.create_source(
+            track.stream_url,
+            data=data,
+            codec=track.codec,
+            ffmpeg_path=ffmpeg_path,
+            volume=volume,
+            start=track.start,
+            guild_id=guild_id,
+            gain=gain
+        )